@@ -1,4 +1,4 @@
-import os, sys, asyncio, socket, logging, signal, threading
+import os, sys, asyncio, socket, logging, signal, threading, atexit
 from typing import Final
 
 from flask import Flask
@@ -6,13 +6,14 @@ from waitress import serve
 
 from app.routes.main_routes import register_routes
 from worker.tracker_worker import run_worker
-from models.models import create_tables
+from models.models import create_tables, dispose_engine
 from app.utils.single_instance import ensure_single_instance
 
 class AppServer:
     def __init__(self, base_dir: str):
         self.base_dir = base_dir
         self.port = int(os.getenv("APP_PORT", 12345))
+        self.threads = int(os.getenv("APP_THREADS", 8))
         self.secret = os.getenv("SECRET_KEY", "supersecret")
 
         # ── Logging ───────────────────────────────────────────
@@ -65,6 +66,7 @@ class AppServer:
         def clean(*_):
             if os.path.exists("app.pid"):
                 os.remove("app.pid")
+            dispose_engine()
             sys.exit(0)
 
         signal.signal(signal.SIGINT, clean)
@@ -74,9 +76,10 @@ class AppServer:
         ensure_single_instance(self.port, self.log)
         self._start_worker()
         self._setup_signals()
+        atexit.register(dispose_engine)
 
         with open("app.pid", "w") as f:
             f.write(str(os.getpid()))
         self.log.info("Server siap di http://localhost:%s", self.port)
 
-        serve(self.app, host="0.0.0.0", port=self.port)
+        serve(self.app, host="0.0.0.0", port=self.port, threads=self.threads)
@@ -2,27 +2,35 @@ import os
 import sys
 import logging
 
+import io
+import csv
+import zlib
 import time
 import base64
 import requests
-import io
 import json
-import re
-import unicodedata
+import threading
+import tempfile
 import psycopg2
 import psycopg2.extras
 from datetime import datetime
 from dateutil import parser
 
-from flask import render_template, request, jsonify, redirect, url_for, flash, send_file
+from flask import render_template, request, jsonify, redirect, url_for, flash, send_file, Response
 from werkzeug.utils import secure_filename
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.drawing.image import Image as XLImage
 from openpyxl.styles import Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 
-from app.utils.helpers import get_departments, get_zone_data, allowed_file
+from app.utils.helpers import get_departments, get_zone_snapshot, get_zone_changes, allowed_file, OFFLINE_BODY
+from app.utils.export_jobs import FILE_PREFIX, ExportJobs, remove_file
+from lib.detail_cache import person_cache
+from lib.device_map import get_device_map
+from lib.metrics import REGISTRY
+from lib.zone_snapshot import snapshots
 from blacklist.blacklist_tracker import BlacklistTracker
 from models.db import get_transaksi_filtered
 
@@ -38,268 +46,447 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def get_zona_from_device(device_name, hijau_key, merah_key):
-    hijau_devices = [d.strip().lower() for d in os.getenv(hijau_key, "").split(",")]
-    merah_devices = [d.strip().lower() for d in os.getenv(merah_key, "").split(",")]
+STREAM_ZONES = {"hijau": ("hijau",), "merah": ("merah",), "all": ("hijau", "merah")}
 
-    name = (device_name or "").lower()
-    hijau = name if any(h in name for h in hijau_devices) else ""
-    merah = name if any(m in name for m in merah_devices) else ""
-    return hijau, merah
+def zone_body(*snapshots_) -> bytes:
+    if len(snapshots_) == 1:
+        snapshot = snapshots_[0]
+        return snapshot.body if snapshot else OFFLINE_BODY
+    # /api/all: gabungkan JSON yang sudah di-serialize tanpa decode/encode ulang
+    hijau, merah = (s.body if s else OFFLINE_BODY for s in snapshots_)
+    return b'{"hijau": ' + hijau + b', "merah": ' + merah + b'}'
 
-def apply_excel_header(ws, tahun: int):
-    for col in "ABCDEFGHIJKLMN":
-        ws.column_dimensions[col].auto_size = True
-    ws.column_dimensions['M'].width = 18
-    ws.column_dimensions['N'].width = 35
-
-    ws.merge_cells('A1:N5')
-    ws.merge_cells('A6:B7')
-    ws.merge_cells('A8:B8')
-    ws.merge_cells('A9:B9')
-    ws.merge_cells('C6:D7')
-    ws.merge_cells('C8:D8')
-    ws.merge_cells('C9:D9')
-    ws.merge_cells('E6:L9')
-    ws.merge_cells('M6:M6')
-    ws.merge_cells('M7:M7')
-    ws.merge_cells('M8:M8')
-    ws.merge_cells('M9:M9')
-    ws.merge_cells('N6:N6')
-    ws.merge_cells('N7:N7')
-    ws.merge_cells('N8:N8')
-    ws.merge_cells('N9:N9')
-    ws.merge_cells('A10:A11')
-    ws.merge_cells('B10:B11')
-    ws.merge_cells('C10:C11')
-    ws.merge_cells('D10:D11')
-    ws.merge_cells('E10:E11')
-    ws.merge_cells('F10:F11')
-    ws.merge_cells('G10:G11')
-    ws.merge_cells('H10:I10')
-    ws.merge_cells('J10:J11')
-    ws.merge_cells('K10:L10')
-    ws.merge_cells('M10:M11')
-    ws.merge_cells('N10:N11')
-
-    ws["A6"] = "HARI"
-    ws["A8"] = "TANGGAL"
-    ws["A9"] = "JAM"
-    ws["E6"] = os.getenv("EXCEL_TITLE", "MONITORING MASUK KELUAR ORANG PT. PLN INDONESIA POWER UBP SURALAYA")
-    ws["M6"] = "NOMOR DOKUMEN"
-    ws["N6"] = os.getenv("NOMOR_DOKUMEN", "PB.13.7.20.7.7FRM.18.SLA")
-    ws["M7"] = "TANGGAL"
-    ws["N7"] = f"15 MEI {tahun}"
-    ws["M8"] = "REVISI"
-    ws["N8"] = "00"
-    ws["M9"] = "HALAMAN"
-
-    ws["A10"] = "NO"
-    ws["B10"] = "NAMA PERUSAHAAN"
-    ws["C10"] = "NAMA PEGAWAI"
-    ws["D10"] = "NIP"
-    ws["E10"] = "JABATAN"
-    ws["F10"] = "JENIS PEKERJAAN"
-    ws["G10"] = "FIRST IN TIME"
-    ws["H10"] = "ZONA MASUK"
-    ws["H11"] = "AREA TERBATAS"
-    ws["I11"] = "AREA TERLARANG"
-    ws["J10"] = "LAST OUT TIME"
-    ws["K10"] = "ZONA KELUAR"
-    ws["K11"] = "AREA TERBATAS"
-    ws["L11"] = "AREA TERLARANG"
-    ws["M10"] = "NO. SPK/LOI/MEMO"
-    ws["N10"] = "PARAF / NAMA ANGGOTA SATPAM"
-
-    align_center = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    border = Border(
+def zone_etag(*snapshots_) -> str:
+    return "-".join(s.etag if s else "offline" for s in snapshots_)
+
+def zone_response(*snapshots_):
+    """
+    Response JSON zona dengan ETag (hash konten) dan Last-Modified (updated_at snapshot).
+    Poll yang datanya belum berubah dijawab 304 tanpa body.
+    """
+    return conditional_response(zone_body(*snapshots_), *snapshots_)
+
+def zone_changes_response(zone, since):
+    """
+    ?since=<version>: kirim hanya perubahan sejak versi tersebut
+    ({"version", "since", "diff"}), atau ringkasan penuh ({"version", "full"}) jika
+    versi sudah tidak ada di history.
+    """
+    snapshot, diff = get_zone_changes(zone, since)
+    if snapshot is None:
+        return conditional_response(OFFLINE_BODY)
+    if diff is None:
+        body = b'{"version": ' + str(snapshot.version).encode() + b', "full": ' + snapshot.body + b'}'
+    else:
+        body = json.dumps({"version": snapshot.version, "since": since, "diff": diff}, default=str).encode()
+    return conditional_response(body, snapshot)
+
+def conditional_response(body, *snapshots_):
+    response = Response(body, mimetype="application/json")
+    response.headers["Cache-Control"] = "no-cache"
+
+    if snapshots_ and all(snapshots_):
+        if len(snapshots_) == 1:
+            response.headers["X-Zone-Version"] = str(snapshots_[0].version)
+        response.set_etag(zone_etag(*snapshots_))
+        response.last_modified = max(s.updated_at for s in snapshots_)
+    return response.make_conditional(request)
+
+def zone_event_stream(zones, last_event_id, heartbeat):
+    """
+    Generator Server-Sent Events: kirim ringkasan setiap kali worker mempublish snapshot baru,
+    komentar heartbeat jika tidak ada perubahan. id event = ETag, sehingga reconnect dengan
+    Last-Event-ID yang masih sama tidak mengirim ulang data.
+    """
+    sent_id = last_event_id
+    yield b"retry: 5000\n\n"
+    while True:
+        version = snapshots.last_version
+        current = [get_zone_snapshot(z) for z in zones]
+        event_id = zone_etag(*current)
+        if event_id != sent_id:
+            yield b"id: " + event_id.encode() + b"\nevent: summary\ndata: " + zone_body(*current) + b"\n\n"
+            sent_id = event_id
+
+        if not snapshots.wait_for_change(version, timeout=heartbeat):
+            yield b": heartbeat\n\n"
+
+# Jumlah baris per fetchmany dari cursor server-side saat export
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "2000"))
+# Folder file export sementara (kosong = folder temp sistem)
+EXPORT_SPOOL_DIR = os.getenv("EXPORT_SPOOL_DIR") or None
+
+EXPORT_COLUMNS = 14
+EXPORT_MIN_WIDTH = 20
+EXPORT_DATA_ROW = 12  # baris pertama data setelah header
+
+EXCEL_HEADER_MERGES = (
+    'A1:N5', 'A6:B7', 'A8:B8', 'A9:B9', 'C6:D7', 'C8:D8', 'C9:D9', 'E6:L9',
+    'M6:M6', 'M7:M7', 'M8:M8', 'M9:M9', 'N6:N6', 'N7:N7', 'N8:N8', 'N9:N9',
+    'A10:A11', 'B10:B11', 'C10:C11', 'D10:D11', 'E10:E11', 'F10:F11', 'G10:G11',
+    'H10:I10', 'J10:J11', 'K10:L10', 'M10:M11', 'N10:N11',
+)
+
+def excel_cell_style(ws, wrap_text: bool):
+    """
+    Style (alignment tengah + border tipis) yang dihitung sekali lalu dipakai bersama
+    semua cell; di mode write-only cell langsung ditulis sehingga style tidak pernah diubah.
+    """
+    template = WriteOnlyCell(ws)
+    template.alignment = Alignment(horizontal="center", vertical="center", wrap_text=wrap_text)
+    template.border = Border(
         left=Side(style='thin'), right=Side(style='thin'),
         top=Side(style='thin'), bottom=Side(style='thin')
     )
+    return template._style
 
-    for row in ws.iter_rows(min_row=6, max_row=11, min_col=1, max_col=14):
-        for cell in row:
-            cell.alignment = align_center
-            cell.border = border
-
-def normalize(text: str) -> str:
-    if not text:
-        return ""
-    # Ubah ke huruf besar, hapus karakter non-alfanumerik, ubah spasi ke _
-    text = unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode("utf-8")
-    text = text.upper()
-    text = re.sub(r"[^\w\s]", "", text)
-    text = re.sub(r"\s+", "_", text)
-    return text.strip()
-
-def match_device_name(device_name: str, device_pos_list: list[str]) -> str:
-    if not device_name:
-        return ""
-
-    norm_device_name = normalize(device_name)
-    normalized_pos_map = {normalize(pos): pos for pos in device_pos_list if pos}
-
-    for norm_pos, original_pos in normalized_pos_map.items():
-        if norm_pos in norm_device_name:
-            # logging.info(f"[MATCH] Device '{device_name}' cocok dengan ENV '{original_pos}'")
-            return original_pos
-
-    # Coba cari pola "POS" + angka
-    match_pos_number = re.search(r'pos[\s_\-]*([0-9]+)', device_name, re.IGNORECASE)
-    if match_pos_number:
-        number = match_pos_number.group(1)
-        label = f"POS {int(number)}"
-        # logging.info(f"[MATCH] Device '{device_name}' dikenali sebagai '{label}' dari angka")
-        return label
-
-    # Cari pola "POS" + label
-    match_pos_label = re.search(r'pos[\s_\-]+([a-zA-Z]+)', device_name, re.IGNORECASE)
-    if match_pos_label:
-        label = match_pos_label.group(1).upper()
-        result = f"POS {label}"
-        # logging.info(f"[MATCH] Device '{device_name}' dikenali sebagai '{result}' dari label")
-        return result
-
-    # Gagal cocokkan
-    # logging.warning(f"[NO MATCH] Device '{device_name}' tidak cocok dengan ENV atau pola")
-    return device_name
-
-def get_attribute_values(conn, person_id: str, attr_names: list[str]) -> dict:
+def styled_row(ws, values, style) -> list:
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value)
+        cell._style = style
+        cells.append(cell)
+    return cells
+
+def apply_excel_header(ws, tahun: int):
+    """
+    Header laporan (baris 1-11) untuk worksheet write-only: merge dicatat,
+    lalu baris header ditulis berurutan sebelum data.
+    """
+    for ref in EXCEL_HEADER_MERGES:
+        ws.merged_cells.add(ref)
+
+    header = {
+        "A6": "HARI",
+        "A8": "TANGGAL",
+        "A9": "JAM",
+        "E6": os.getenv("EXCEL_TITLE", "MONITORING MASUK KELUAR ORANG PT. PLN INDONESIA POWER UBP SURALAYA"),
+        "M6": "NOMOR DOKUMEN",
+        "N6": os.getenv("NOMOR_DOKUMEN", "PB.13.7.20.7.7FRM.18.SLA"),
+        "M7": "TANGGAL",
+        "N7": f"15 MEI {tahun}",
+        "M8": "REVISI",
+        "N8": "00",
+        "M9": "HALAMAN",
+        "A10": "NO",
+        "B10": "NAMA PERUSAHAAN",
+        "C10": "NAMA PEGAWAI",
+        "D10": "NIP",
+        "E10": "JABATAN",
+        "F10": "JENIS PEKERJAAN",
+        "G10": "FIRST IN TIME",
+        "H10": "ZONA MASUK",
+        "H11": "AREA TERBATAS",
+        "I11": "AREA TERLARANG",
+        "J10": "LAST OUT TIME",
+        "K10": "ZONA KELUAR",
+        "K11": "AREA TERBATAS",
+        "L11": "AREA TERLARANG",
+        "M10": "NO. SPK/LOI/MEMO",
+        "N10": "PARAF / NAMA ANGGOTA SATPAM",
+    }
+
+    # Baris 1-5 kosong (area logo), baris 6-11 diberi border + rata tengah
+    for _ in range(5):
+        ws.append([])
+    style = excel_cell_style(ws, wrap_text=True)
+    letters = [get_column_letter(col) for col in range(1, EXPORT_COLUMNS + 1)]
+    for row in range(6, EXPORT_DATA_ROW):
+        ws.append(styled_row(ws, (header.get(f"{letter}{row}") for letter in letters), style))
+
+def add_excel_logos(ws):
+    ip_logo_path = os.getenv("EXCEL_LOGO_KIRI")
+    ipp_logo_path = os.getenv("EXCEL_LOGO_KANAN")
+
+    if ip_logo_path and os.path.exists(ip_logo_path):
+        img = XLImage(ip_logo_path)
+        img.height = 50
+        img.anchor = 'A2'
+        ws.add_image(img)
+
+    if ipp_logo_path and os.path.exists(ipp_logo_path):
+        img2 = XLImage(ipp_logo_path)
+        img2.height = 40
+        img2.anchor = 'H2'
+        ws.add_image(img2)
+
+# Jumlah person_id per query pers_attribute_ext (batas ukuran array parameter)
+ATTRIBUTE_CHUNK = int(os.getenv("EXPORT_ATTRIBUTE_CHUNK", "2000"))
+
+def get_attribute_indexes(conn, attr_names: list[str]) -> dict:
     """
-    Mengembalikan dictionary: {attr_name: value}, berdasarkan filed_index dari pers_attribute.
-    Ambil data dari pers_attribute_ext berdasarkan kolom bernama attr_value{index}.
+    {attr_name: filed_index} dari pers_attribute, satu query untuk semua atribut.
+    Atribut yang tidak ada di pers_attribute dilewati.
     """
     attr_names = [attr.strip().upper() for attr in attr_names if attr.strip()]
     if not attr_names:
         return {}
 
-    filed_indexes = {}
     with conn.cursor() as cursor:
-        # Step 1: Ambil filed_index untuk setiap attr_name dari pers_attribute
-        for attr in attr_names:
-            cursor.execute("""
-                SELECT filed_index
-                FROM pers_attribute
-                WHERE UPPER(attr_name) = %s
-                LIMIT 1
-            """, (attr,))
-            res = cursor.fetchone()
-            if res and res[0] is not None:
-                filed_indexes[attr] = res[0]
-
-        if not filed_indexes:
-            return {}
-
-        # Step 2: Ambil kolom attr_valueN sesuai filed_index
-        column_names = [f"attr_value{index}" for index in filed_indexes.values()]
-        sql_columns = ", ".join(column_names)
+        cursor.execute("""
+            SELECT UPPER(attr_name), filed_index
+            FROM pers_attribute
+            WHERE UPPER(attr_name) = ANY(%s) AND filed_index IS NOT NULL
+        """, (attr_names,))
+        found = {}
+        for attr, index in cursor.fetchall():
+            found.setdefault(attr, index)
+
+    # Urutan mengikuti ATTRIBUT_TRANSAKSI
+    return {attr: found[attr] for attr in attr_names if attr in found}
+
+def get_attribute_values_bulk(conn, person_ids, filed_indexes: dict) -> dict:
+    """
+    {person_id: {attr_name: value}} untuk semua person_id sekaligus: kolom attr_value{index}
+    dari pers_attribute_ext, satu query per ATTRIBUTE_CHUNK id. Person tanpa baris ext tidak ada di hasil.
+    """
+    ids = list({pid for pid in person_ids if pid})
+    if not ids or not filed_indexes:
+        return {}
 
+    # filed_index berasal dari DB (integer), aman dipakai sebagai nama kolom
+    sql_columns = ", ".join(f"attr_value{int(index)}" for index in filed_indexes.values())
+    attrs = list(filed_indexes)
+
+    values = {}
+    with conn.cursor() as cursor:
+        for i in range(0, len(ids), ATTRIBUTE_CHUNK):
+            cursor.execute(f"""
+                SELECT DISTINCT ON (person_id) person_id, {sql_columns}
+                FROM pers_attribute_ext
+                WHERE person_id = ANY(%s)
+                ORDER BY person_id
+            """, (ids[i:i + ATTRIBUTE_CHUNK],))
+            for row in cursor.fetchall():
+                values[row[0]] = {attr: value if value is not None else "" for attr, value in zip(attrs, row[1:])}
+
+    return values
+
+def export_attr_names() -> list[str]:
+    # Atribut dari ENV (huruf besar): NIP, jenis pekerjaan, jabatan, no. SPK sesuai urutan
+    return [a.strip().upper() for a in os.getenv("ATTRIBUT_TRANSAKSI", "").split(",") if a.strip()]
+
+def export_filter(from_date, to_date, pin="", nama="", dept=""):
+    """(kondisi WHERE, parameter) acc_firstin_lastout sesuai filter halaman transaksi."""
+    where = "update_time BETWEEN %s AND %s"
+    params = [from_date, to_date]
+
+    if pin:
+        where += " AND pin ILIKE %s"
+        params.append(f"%{pin}%")
+    if nama:
+        where += " AND name ILIKE %s"
+        params.append(f"%{nama}%")
+    if dept:
+        where += " AND dept_name ILIKE %s"
+        params.append(f"%{dept}%")
+
+    return where, params
+
+def export_column_widths(conn, where: str, params: list, filed_indexes: dict) -> tuple[int, list[int]]:
+    """
+    (jumlah baris, lebar kolom A-N) dihitung dengan agregat SQL sebelum menulis, karena di mode
+    write-only lebar kolom harus ditulis sebelum baris pertama. Lebar = panjang isi terpanjang + 2,
+    minimal EXPORT_MIN_WIDTH. Kolom zona memakai panjang nama reader / DEVICE_POS terpanjang
+    (label DeviceMap tidak pernah lebih panjang dari keduanya).
+    """
+    attr_names = export_attr_names()
+    with conn.cursor() as cursor:
         cursor.execute(f"""
-            SELECT {sql_columns}
-            FROM pers_attribute_ext
-            WHERE person_id = %s
-            LIMIT 1
-        """, (person_id,))
-        row = cursor.fetchone()
-
-    if not row:
-        return {}
+            SELECT COUNT(*), MAX(LENGTH(dept_name)), MAX(LENGTH(name)),
+                   MAX(LENGTH(reader_name_in)), MAX(LENGTH(reader_name_out)),
+                   COUNT(first_in_time), COUNT(last_out_time)
+            FROM acc_firstin_lastout
+            WHERE {where}
+        """, params)
+        total, dept_len, name_len, in_len, out_len, has_in, has_out = cursor.fetchone()
+
+        attr_len = {}
+        if total and filed_indexes:
+            columns = ", ".join(f"MAX(LENGTH(attr_value{int(index)}))" for index in filed_indexes.values())
+            cursor.execute(f"""
+                SELECT {columns}
+                FROM pers_attribute_ext
+                WHERE person_id IN (SELECT id FROM acc_firstin_lastout WHERE {where})
+            """, params)
+            attr_len = dict(zip(filed_indexes, cursor.fetchone()))
+
+    def attr_width(position):
+        return attr_len.get(attr_names[position]) if len(attr_names) > position else None
+
+    pos_len = max((len(pos) for pos in get_device_map().device_pos), default=0)
+    time_len = len("YYYY-mm-dd HH:MM:SS")
+    lengths = [
+        len(str(total)),
+        dept_len, name_len, attr_width(0), attr_width(2), attr_width(1),
+        time_len if has_in else 0,
+        max(in_len or 0, pos_len), max(in_len or 0, pos_len),
+        time_len if has_out else 0,
+        max(out_len or 0, pos_len), max(out_len or 0, pos_len),
+        attr_width(3), 0,
+    ]
+    return total, [max((length or 0) + 2, EXPORT_MIN_WIDTH) for length in lengths]
+
+def iter_export_records(conn, where: str, params: list, fetch_size: int = EXPORT_FETCH_SIZE):
+    """Batch baris acc_firstin_lastout dari cursor server-side; memori hanya sebesar satu batch."""
+    with conn.cursor(name="export_firstin_lastout", cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.itersize = fetch_size
+        cur.execute(f"""
+            SELECT * FROM acc_firstin_lastout
+            WHERE {where}
+            ORDER BY first_in_time NULLS LAST
+        """, params)
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+
+def export_row_batches(batches, conn, filed_indexes: dict):
+    """
+    Baris laporan (nilai kolom A-N) per batch record dari iter_export_records: zona/device
+    dipetakan dan atribut diambil massal per batch. Dipakai export XLSX dan CSV.
+    filed_indexes dari get_attribute_indexes, dicari sekali per export oleh pemanggil.
+    """
+    attr_names = export_attr_names()
+    devices = get_device_map()
+
+    no = 0
+    for records in batches:
+        attr_by_person = get_attribute_values_bulk(conn, (r.get("id") for r in records), filed_indexes)
+
+        rows = []
+        for record in records:
+            no += 1
+            dept_name = record.get("dept_name", "")
+            name = record.get("name", "")
+            person_id = record.get("id", "")
+
+            first_in = record["first_in_time"].strftime("%Y-%m-%d %H:%M:%S") if record.get("first_in_time") else ""
+            last_out = record["last_out_time"].strftime("%Y-%m-%d %H:%M:%S") if record.get("last_out_time") else ""
+
+            # Zona hijau/merah + label POS dari nama reader (dimemo per nama device)
+            device_in = devices.lookup(record.get("reader_name_in", ""), "in")
+            device_out = devices.lookup(record.get("reader_name_out", ""), "out")
+
+            # Data tambahan dari pers_attribute_ext (sudah diambil massal per batch)
+            attr_values = attr_by_person.get(person_id, {})
+
+            # Ambil nilai-nilai spesifik dari attr_values sesuai urutan
+            nip = attr_values.get(attr_names[0], "") if len(attr_names) > 0 else ""
+            jenis_pekerjaan = attr_values.get(attr_names[1], "") if len(attr_names) > 1 else ""
+            jabatan = attr_values.get(attr_names[2], "") if len(attr_names) > 2 else ""
+            no_po = attr_values.get(attr_names[3], "") if len(attr_names) > 3 else ""
+
+            rows.append([
+                no,
+                dept_name, name, nip,
+                jabatan, jenis_pekerjaan, first_in,
+                device_in.label("hijau"), device_in.label("merah"),
+                last_out,
+                device_out.label("hijau"), device_out.label("merah"),
+                no_po, ""
+            ])
+
+        yield rows
+
+def write_excel_data(ws, batches, conn, filed_indexes: dict, progress=None) -> int:
+    """
+    Tulis baris data per batch record (iter_export_records); kembalikan jumlah baris.
+    progress(written) dipanggil setelah tiap batch.
+    """
+    style = excel_cell_style(ws, wrap_text=False)
 
-    attr_values = {}
-    for i, (attr, index) in enumerate(filed_indexes.items()):
-        col_name = f"attr_value{index}"
-        value = row[i] if i < len(row) else None
-        attr_values[attr] = value if value is not None else ""
+    no = 0
+    for rows in export_row_batches(batches, conn, filed_indexes):
+        # Tulis ke worksheet (langsung ke file, tidak disimpan di memori)
+        for values in rows:
+            ws.append(styled_row(ws, values, style))
+        no += len(rows)
 
-    return attr_values
+        if progress:
+            progress(no)
 
-def write_excel_data(ws, records, conn):
-    align_center = Alignment(horizontal="center", vertical="center", wrap_text=False)
-    border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
+    return no
+
+def build_excel_export(conn, where: str, params: list, path: str, progress=None) -> int:
+    """
+    Export XLSX ke file path dengan memori tetap: cursor server-side + workbook write-only.
+    Kembalikan jumlah baris; 0 berarti tidak ada data dan file tidak ditulis.
+    progress(written, total) dipanggil setelah jumlah baris diketahui dan setiap batch.
+    """
+    filed_indexes = get_attribute_indexes(conn, export_attr_names())
+    total, widths = export_column_widths(conn, where, params, filed_indexes)
+    if not total:
+        return 0
+    if progress:
+        progress(0, total)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet")
+    for col_idx, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+    apply_excel_header(ws, datetime.now().year)
+    add_excel_logos(ws)
+    written = write_excel_data(
+        ws, iter_export_records(conn, where, params), conn, filed_indexes,
+        (lambda rows: progress(rows, total)) if progress else None,
     )
+    wb.save(path)
+    return written
+
+# Kolom CSV = kolom data XLSX (header dua baris digabung), tanpa kolom paraf satpam
+EXPORT_CSV_HEADER = [
+    "NO", "NAMA PERUSAHAAN", "NAMA PEGAWAI", "NIP", "JABATAN", "JENIS PEKERJAAN",
+    "FIRST IN TIME", "ZONA MASUK AREA TERBATAS", "ZONA MASUK AREA TERLARANG",
+    "LAST OUT TIME", "ZONA KELUAR AREA TERBATAS", "ZONA KELUAR AREA TERLARANG",
+    "NO. SPK/LOI/MEMO",
+]
+
+EXPORT_FORMATS = {
+    # format: (ekstensi file, mimetype)
+    "xlsx": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": (".csv", "text/csv; charset=utf-8"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+}
+
+def export_has_rows(conn, where: str, params: list) -> bool:
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM acc_firstin_lastout WHERE {where})", params)
+        return cursor.fetchone()[0]
 
-    # Ambil atribut dari ENV dan pastikan huruf besar
-    attr_names = [a.strip().upper() for a in os.getenv("ATTRIBUT_TRANSAKSI", "").split(",") if a.strip()]
-    device_pos_list = [x.strip() for x in os.getenv("DEVICE_POS", "").split(",") if x.strip()]
-
-    row_num = 12
-    no = 1
-
-    for record in records:
-        dept_name = record.get("dept_name", "")
-        name = record.get("name", "")
-        pin = record.get("pin", "")
-        person_id = record.get("id", "")
-
-        first_in = record["first_in_time"].strftime("%Y-%m-%d %H:%M:%S") if record.get("first_in_time") else ""
-        last_out = record["last_out_time"].strftime("%Y-%m-%d %H:%M:%S") if record.get("last_out_time") else ""
-
-        # Nama device dari DB
-        device_in_raw = record.get("reader_name_in", "")
-        device_out_raw = record.get("reader_name_out", "")
-
-        # Zona hijau/merah
-        hijauin, merahin = get_zona_from_device(device_in_raw, "IN_DEVICES_HIJAU", "IN_DEVICES_MERAH")
-        hijauout, merahout = get_zona_from_device(device_out_raw, "OUT_DEVICES_HIJAU", "OUT_DEVICES_MERAH")
-
-        # Pemetaan nama device
-        device_in_hijau = match_device_name(hijauin, device_pos_list)
-        device_in_merah = match_device_name(merahin, device_pos_list)
-        device_out_hijau = match_device_name(hijauout, device_pos_list)
-        device_out_merah = match_device_name(merahout, device_pos_list)
-
-        # Ambil data tambahan dari pers_attribute_ext
-        attr_values = get_attribute_values(conn, person_id, attr_names)
-
-        # Ambil nilai-nilai spesifik dari attr_values sesuai urutan
-        nip = attr_values.get(attr_names[0], "") if len(attr_names) > 0 else ""
-        jenis_pekerjaan = attr_values.get(attr_names[1], "") if len(attr_names) > 1 else ""
-        jabatan = attr_values.get(attr_names[2], "") if len(attr_names) > 2 else ""
-        no_po = attr_values.get(attr_names[3], "") if len(attr_names) > 3 else ""
-
-        # Tulis ke worksheet
-        ws.append([
-            no,
-            dept_name, name, nip,
-            jabatan, jenis_pekerjaan, first_in,
-            device_in_hijau, device_in_merah,
-            last_out,
-            device_out_hijau, device_out_merah,
-            no_po, ""
-        ])
-
-        # Format cell
-        for cell in next(ws.iter_rows(min_row=row_num, max_row=row_num, min_col=1, max_col=14)):
-            cell.alignment = align_center
-            cell.border = border
-
-        row_num += 1
-        no += 1
-
-    return row_num
-
-def auto_adjust_column_width(ws, start_row=12, min_width=20):
-    column_widths = {}
-
-    for row in ws.iter_rows(min_row=start_row, values_only=True):
-        for i, cell_value in enumerate(row, 1):
-            if cell_value is None:
-                continue
-            length = len(str(cell_value))
-            if i not in column_widths:
-                column_widths[i] = length
-            else:
-                if length > column_widths[i]:
-                    column_widths[i] = length
-
-    max_col = ws.max_column
-    for col_idx in range(1, max_col + 1):
-        width = column_widths.get(col_idx, 0)
-        final_width = max(width + 2, min_width)
-        col_letter = get_column_letter(col_idx)
-        ws.column_dimensions[col_letter].width = final_width
+def iter_csv_export(conn, where: str, params: list, compress: bool = False):
+    """
+    Generator chunk CSV (bytes) untuk response streaming: header langsung dikirim, lalu satu
+    chunk per batch cursor server-side, jadi memori tetap dan byte pertama tidak menunggu query.
+    compress=True → stream gzip (isi file .csv.gz), di-flush per batch agar tetap mengalir.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def chunk() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        if gzip:
+            return gzip.compress(data) + gzip.flush(zlib.Z_SYNC_FLUSH)
+        return data
+
+    writer.writerow(EXPORT_CSV_HEADER)
+    yield chunk()
+
+    filed_indexes = get_attribute_indexes(conn, export_attr_names())
+    written = 0
+    for rows in export_row_batches(iter_export_records(conn, where, params), conn, filed_indexes):
+        writer.writerows(row[:len(EXPORT_CSV_HEADER)] for row in rows)
+        written += len(rows)
+        yield chunk()
+
+    if gzip:
+        yield gzip.flush()
+    logger.info(f"Export CSV selesai: {written} data")
 
 def register_routes(app):
     token = os.getenv("ACCESS_TOKEN")
@@ -312,6 +499,10 @@ def register_routes(app):
     def get_conn():
         return psycopg2.connect(dsn=os.getenv("DATABASE_URL"))
 
+    # Tiap stream SSE memegang satu thread waitress, jadi jumlahnya dibatasi
+    stream_heartbeat = int(os.getenv("SSE_HEARTBEAT_SEC", "15"))
+    stream_slots = threading.BoundedSemaphore(int(os.getenv("SSE_MAX_STREAMS", "4")))
+
     ZONA_HIJAU = [z.strip().lower() for z in os.getenv("ZONA_HIJAU", "").split(",")]
     ZONA_MERAH = [z.strip().lower() for z in os.getenv("ZONA_MERAH", "").split(",")]
 
@@ -322,80 +513,141 @@ def register_routes(app):
     # == Tambahkan route ini di bawah semua route lain ==
     @app.route('/export')
     def export():
-        conn = get_conn()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
         from_date = request.args.get("from")
         to_date = request.args.get("to")
         nama = request.args.get("nama", "")
         dept = request.args.get("dept", "")
         pin = request.args.get("id", "")
+        export_format = request.args.get("format", "xlsx").lower()
 
         if not from_date or not to_date:
             return {"error": "Parameter 'from' dan 'to' harus diisi."}, 400
+        if export_format not in EXPORT_FORMATS:
+            return {"error": "Parameter 'format' harus xlsx, csv atau csv.gz."}, 400
 
-        query = "SELECT * FROM acc_firstin_lastout WHERE update_time BETWEEN %s AND %s"
-        params = [from_date, to_date]
-
-        if pin:
-            query += " AND pin ILIKE %s"
-            params.append(f"%{pin}%")
-        if nama:
-            query += " AND name ILIKE %s"
-            params.append(f"%{nama}%")
-        if dept:
-            query += " AND dept_name ILIKE %s"
-            params.append(f"%{dept}%")
+        where, params = export_filter(from_date, to_date, pin, nama, dept)
+        suffix, mimetype = EXPORT_FORMATS[export_format]
+        file_name = f"transaction_plnn_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}"
 
-        query += " ORDER BY first_in_time NULLS LAST"
-        cur.execute(query, tuple(params))
-        records = cur.fetchall()
+        if export_format != "xlsx":
+            return csv_export_response(where, params, export_format == "csv.gz", file_name, mimetype)
 
-        wb = Workbook()
-        ws = wb.active
-        tahun = datetime.now().year
+        # File ditulis ke disk (bukan BytesIO) lalu di-stream ke client dan dihapus setelah terkirim
+        fd, path = tempfile.mkstemp(prefix=FILE_PREFIX, suffix=".xlsx", dir=EXPORT_SPOOL_DIR)
+        os.close(fd)
+        conn = get_conn()
+        try:
+            total = build_excel_export(conn, where, params, path)
+        except Exception as e:
+            remove_file(path)
+            logger.error(f"Gagal menyimpan file Excel: {e}")
+            return {"error": "Gagal menyimpan file."}, 500
+        finally:
+            conn.close()
 
-        if not records:
+        if not total:
+            remove_file(path)
             logger.info(f"Export kosong dari {request.remote_addr}: {from_date} - {to_date}, filter={nama or pin or dept}")
             return {"error": "Data tidak ditemukan dalam rentang waktu tersebut."}, 404
 
-        logger.info(f"Export berhasil oleh {request.remote_addr}: {len(records)} data dari {from_date} ke {to_date}, filter={nama or pin or dept}")
-
-        apply_excel_header(ws, tahun)
-        write_excel_data(ws, records, conn)
-        auto_adjust_column_width(ws)
-
-        ip_logo_path = os.getenv("EXCEL_LOGO_KIRI")
-        ipp_logo_path = os.getenv("EXCEL_LOGO_KANAN")
+        logger.info(f"Export berhasil oleh {request.remote_addr}: {total} data dari {from_date} ke {to_date}, filter={nama or pin or dept}")
 
-        if ip_logo_path and os.path.exists(ip_logo_path):
-            img = XLImage(ip_logo_path)
-            img.height = 50
-            img.anchor = 'A2'
-            ws.add_image(img)
+        response = send_file(
+            path,
+            as_attachment=True,
+            download_name=file_name,
+            mimetype=mimetype
+        )
+        response.call_on_close(lambda: remove_file(path))
+        return response
+
+    def csv_export_response(where, params, compress, file_name, mimetype):
+        """
+        CSV / CSV.gz di-stream langsung dari cursor (chunked transfer, tanpa file sementara).
+        Koneksi ikut dipakai generator dan ditutup saat response selesai atau client memutus.
+        """
+        conn = get_conn()
+        try:
+            has_rows = export_has_rows(conn, where, params)
+        except Exception as e:
+            conn.close()
+            logger.error(f"Gagal membaca data export: {e}")
+            return {"error": "Gagal menyimpan file."}, 500
 
-        if ipp_logo_path and os.path.exists(ipp_logo_path):
-            img2 = XLImage(ipp_logo_path)
-            img2.height = 40
-            img2.anchor = 'H2'
-            ws.add_image(img2)
+        if not has_rows:
+            conn.close()
+            logger.info(f"Export kosong dari {request.remote_addr}: {params}")
+            return {"error": "Data tidak ditemukan dalam rentang waktu tersebut."}, 404
 
-        virtual_file = io.BytesIO()
+        logger.info(f"Export {file_name} dimulai oleh {request.remote_addr}: {params}")
+        response = Response(iter_csv_export(conn, where, params, compress), content_type=mimetype)
+        response.headers["Content-Disposition"] = f'attachment; filename="{file_name}"'
+        response.headers["Cache-Control"] = "no-cache"
+        response.call_on_close(conn.close)
+        return response
 
+    # ─── Export di background (halaman transaksi) ─
+    def run_export_job(params, path, progress):
+        conn = get_conn()
         try:
-            wb.save(virtual_file)
-        except Exception as e:
-            logger.error(f"Gagal menyimpan file Excel: {e}")
-            return {"error": "Gagal menyimpan file."}, 500
+            where, query_params = export_filter(**params)
+            return build_excel_export(conn, where, query_params, path, progress)
+        finally:
+            conn.close()
+
+    export_jobs = ExportJobs(run_export_job, spool_dir=EXPORT_SPOOL_DIR)
+
+    @app.route('/export/start', methods=["POST"])
+    def export_start():
+        params = {
+            "from_date": request.args.get("from"),
+            "to_date": request.args.get("to"),
+            "pin": request.args.get("id", ""),
+            "nama": request.args.get("nama", ""),
+            "dept": request.args.get("dept", ""),
+        }
+        if not params["from_date"] or not params["to_date"]:
+            return {"error": "Parameter 'from' dan 'to' harus diisi."}, 400
 
-        virtual_file.seek(0)
+        # Filter yang sama → job yang sama selama masih berjalan
+        key = ("xlsx",) + tuple(params.values())
         file_name = f"transaction_plnn_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        return send_file(
-            virtual_file,
-            as_attachment=True,
-            download_name=file_name,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        job = export_jobs.submit(key, params, ".xlsx", file_name)
+        if job is None:
+            return {"error": "Antrian export penuh, coba lagi nanti."}, 503, {"Retry-After": "30"}
+
+        logger.info(f"Export job {job.id} ({job.status}) oleh {request.remote_addr}: {params}")
+        return job.as_dict(), 202
+
+    @app.route('/export/status/<job_id>')
+    def export_status(job_id):
+        job = export_jobs.get(job_id)
+        if job is None:
+            return {"error": "Job export tidak ditemukan atau sudah kedaluwarsa."}, 404
+        return job.as_dict()
+
+    @app.route('/export/download/<job_id>')
+    def export_download(job_id):
+        job = export_jobs.open_download(job_id)
+        if job is None:
+            job = export_jobs.get(job_id)
+            if job is None:
+                return {"error": "Job export tidak ditemukan atau sudah kedaluwarsa."}, 404
+            return job.as_dict(), 409
+
+        # File ditahan (tidak di-expire) sampai response selesai dikirim
+        try:
+            response = send_file(
+                job.path,
+                as_attachment=True,
+                download_name=job.file_name,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            )
+        except Exception:
+            export_jobs.close_download(job)
+            raise
+        response.call_on_close(lambda: export_jobs.close_download(job))
+        return response
 
 
     @app.context_processor
@@ -431,11 +683,41 @@ def register_routes(app):
     # ─── API Zone Data ─────────────────
     @app.route("/api/data")
     def api_data():
-        return jsonify(get_zone_data("hijau"))
+        since = request.args.get("since", type=int)
+        if since is not None:
+            return zone_changes_response("hijau", since)
+        return zone_response(get_zone_snapshot("hijau"))
 
     @app.route("/api/merah")
     def api_merah():
-        return jsonify(get_zone_data("merah"))
+        since = request.args.get("since", type=int)
+        if since is not None:
+            return zone_changes_response("merah", since)
+        return zone_response(get_zone_snapshot("merah"))
+
+    @app.route("/api/stream")
+    def api_stream():
+        zone = request.args.get("zone", "all")
+        if zone not in STREAM_ZONES:
+            return {"error": "Parameter 'zone' harus hijau, merah atau all."}, 400
+
+        if not stream_slots.acquire(blocking=False):
+            return Response("Stream penuh", status=503, headers={"Retry-After": "60"})
+
+        last_event_id = request.headers.get("Last-Event-ID")
+        stream = zone_event_stream(STREAM_ZONES[zone], last_event_id, stream_heartbeat)
+        response = Response(stream, mimetype="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+        # Slot dilepas saat waitress menutup response (client disconnect terdeteksi saat heartbeat)
+        response.call_on_close(stream_slots.release)
+        return response
+
+    # ─── Metrics (format teks Prometheus) ─
+    @app.route("/metrics")
+    def metrics():
+        return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
     @app.route("/api/blacklist")
     def api_blacklist():
@@ -443,13 +725,7 @@ def register_routes(app):
 
     @app.route("/api/all")
     def api_all():
-        data_hijau = get_zone_data("hijau")
-        data_merah = get_zone_data("merah")
-
-        return jsonify({
-            "hijau": data_hijau,
-            "merah": data_merah
-        })
+        return zone_response(get_zone_snapshot("hijau"), get_zone_snapshot("merah"))
 
     @app.route("/api/transaksi")
     def api_transaksi():
@@ -640,6 +916,8 @@ def register_routes(app):
 
                 if msg == "success":
                     flash("Registrasi berhasil", "success")
+                    # Pin baru bisa saja sudah tercatat NOT_FOUND di cache detail worker
+                    person_cache.invalidate(pin)
 
                     attr_names = os.getenv("ATTRIBUT_REGISTER", "").split(",")
                     attr_names = [a.strip() for a in attr_names if a.strip()]
@@ -683,6 +961,7 @@ def register_routes(app):
                             cur.execute(update_query, (value, person_id))
 
                         conn.commit()
+                        person_cache.invalidate(pin)
                         cur.close()
                         conn.close()
 
@@ -0,0 +1,171 @@
+import os
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = "counting_export_"
+
+
+def remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return True
+    except OSError as e:
+        # Windows: file masih dibuka (download berjalan) → dicoba lagi saat expire berikutnya
+        logger.warning(f"Gagal menghapus file export {path}: {e}")
+        return False
+
+
+class ExportJob:
+    def __init__(self, key: tuple, params: dict, path: str, file_name: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params
+        self.path = path
+        self.file_name = file_name
+        self.status = "queued"  # queued → running → done / empty / error → expired
+        self.written = 0
+        self.total = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.downloads = 0  # download yang sedang berjalan; file tidak dihapus selama > 0
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "written": self.written,
+            "total": self.total,
+            "error": self.error,
+            "file_name": self.file_name if self.status == "done" else None,
+        }
+
+
+class ExportJobs:
+    """
+    Antrian export di background agar request /export tidak menahan thread waitress.
+    build(params, path, progress) menulis file ke path dan mengembalikan jumlah baris
+    (0 = tidak ada data); progress(written, total) dipanggil per batch.
+    Request identik yang masih berjalan memakai job yang sama; file selesai dihapus setelah TTL
+    oleh thread pembersih (tidak menunggu request berikutnya), kecuali sedang di-download.
+    """
+
+    def __init__(self, build: Callable, workers: Optional[int] = None, max_jobs: Optional[int] = None,
+                 ttl: Optional[float] = None, spool_dir: Optional[str] = None):
+        self.build = build
+        self.workers = int(workers or os.getenv("EXPORT_WORKERS", "2"))
+        self.max_jobs = int(max_jobs or os.getenv("EXPORT_MAX_JOBS", "8"))
+        self.ttl = float(ttl or os.getenv("EXPORT_JOB_TTL_SEC", "900"))
+        self.spool_dir = spool_dir
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, ExportJob] = {}
+        self._active: Dict[tuple, str] = {}  # key → id job queued/running
+        self._remove_stale_files()
+
+        self._sweeper = threading.Thread(target=self._sweep, name="export-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep(self):
+        interval = max(1.0, min(self.ttl / 2, 60.0))
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                self._expire()
+
+    def _remove_stale_files(self):
+        # Sisa file dari proses sebelumnya (restart saat export berjalan / sebelum TTL)
+        folder = self.spool_dir or tempfile.gettempdir()
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return
+        cutoff = time.time() - self.ttl
+        for name in names:
+            path = os.path.join(folder, name)
+            if name.startswith(FILE_PREFIX) and os.path.getmtime(path) < cutoff:
+                remove_file(path)
+
+    def _expire(self):
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.downloads:
+                continue  # file sedang dikirim, dicoba lagi di putaran berikutnya
+            if job.finished is not None and now - job.finished > self.ttl:
+                job.status = "expired"
+                if remove_file(job.path):
+                    del self._jobs[job.id]
+
+    def submit(self, key: tuple, params: dict, suffix: str, file_name: str) -> Optional[ExportJob]:
+        """Job baru atau job identik yang masih berjalan; None jika antrian penuh."""
+        with self._lock:
+            self._expire()
+            running = self._active.get(key)
+            if running is not None:
+                return self._jobs[running]
+            if len(self._active) >= self.max_jobs:
+                return None
+
+            fd, path = tempfile.mkstemp(prefix=FILE_PREFIX, suffix=suffix, dir=self.spool_dir)
+            os.close(fd)
+            job = ExportJob(key, params, path, file_name)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job: ExportJob):
+        job.status = "running"
+
+        def progress(written: int, total: Optional[int]):
+            job.written = written
+            job.total = total
+
+        try:
+            rows = self.build(job.params, job.path, progress)
+            job.written = rows
+            if rows:
+                job.status = "done"
+            else:
+                job.status = "empty"
+                job.error = "Data tidak ditemukan dalam rentang waktu tersebut."
+            logger.info(f"Export job {job.id} selesai: {rows} data, filter={job.params}")
+        except Exception as e:
+            logger.exception(f"Export job {job.id} gagal: {e}")
+            job.status = "error"
+            job.error = "Gagal menyimpan file."
+        finally:
+            if job.status != "done":
+                remove_file(job.path)
+            with self._lock:
+                job.finished = time.time()
+                self._active.pop(job.key, None)
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def open_download(self, job_id: str) -> Optional[ExportJob]:
+        """Job selesai yang filenya ditahan sampai close_download(); None jika belum/tidak ada."""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "done":
+                return None
+            job.downloads += 1
+            return job
+
+    def close_download(self, job: ExportJob):
+        with self._lock:
+            job.downloads -= 1
@@ -3,7 +3,11 @@ import sys
 import json
 import requests
 import psycopg2
-from models.models import get_session, ZoneData
+from models.models import get_session, ZoneData, ZoneDataDelta
+from lib.zone_snapshot import snapshots
+from lib.summary_diff import apply_diff
+
+OFFLINE_BODY = b'{"offline": true}'
 
 def get_conn():
     try:
@@ -30,11 +34,42 @@ def get_departments():
         print(f"Error fetching departments: {e}")
     return result
 
-def get_zone_data(zone):
+def get_zone_snapshot(zone):
+    """Snapshot dari memori; DB hanya dibaca saat cold start atau jika snapshot DB sudah basi."""
+    snapshot = snapshots.get(zone)
+    if snapshot is not None:
+        return snapshot
+
     try:
         with get_session() as session:
             record = session.query(ZoneData).filter_by(zone=zone).first()
-            return json.loads(record.data) if record else {"offline": True}
+            if not record:
+                return snapshots.publish(zone, OFFLINE_BODY, source="db")
+
+            # Checkpoint penuh + delta setelahnya
+            deltas = (
+                session.query(ZoneDataDelta)
+                .filter_by(zone=zone)
+                .order_by(ZoneDataDelta.version)
+                .all()
+            )
+            if not deltas:
+                return snapshots.publish(zone, record.data, record.updated_at, source="db")
+
+            data = json.loads(record.data)
+            for delta in deltas:
+                data = apply_diff(data, json.loads(delta.data))
+            return snapshots.publish(zone, json.dumps(data), deltas[-1].created_at, source="db")
     except Exception as e:
         print(f"[ZoneData ERROR] {e}")
-        return {"offline": True}
+        return None
+
+def get_zone_changes(zone, since):
+    """(snapshot, diff sejak versi `since` atau None jika client perlu data penuh)."""
+    if get_zone_snapshot(zone) is None:
+        return None, None
+    return snapshots.changes_since(zone, since)
+
+def get_zone_data(zone):
+    snapshot = get_zone_snapshot(zone)
+    return json.loads(snapshot.body) if snapshot else {"offline": True}
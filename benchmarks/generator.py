@@ -0,0 +1,237 @@
+"""
+Generator lalu lintas gate sintetis (deterministik per seed) untuk benchmark pipeline tracker.
+
+Pola yang dibuat:
+- shift pagi / sore / malam (shift malam melewati tengah malam), plus staf kantor
+  yang keluar-masuk saat istirahat;
+- device -READER: dev_alias berisi nama panel, titik gate ada di event_point_name;
+- tap ganda, lupa tap keluar (possibly_stuck) dan device yang tidak terdaftar;
+- visitor (vis_visitor_lastaddr + vis_transaction) untuk hari ini.
+"""
+import random
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+from lib.event_record import EventRecord
+
+SHIFTS = {
+    # nama: (jam masuk, durasi jam, bobot)
+    "pagi": (7.5, 9.0, 0.5),
+    "sore": (15.0, 8.0, 0.15),
+    "malam": (22.0, 8.5, 0.15),
+    "kantor": (8.0, 8.5, 0.2),
+}
+
+DEPARTMENTS = ["OPERASI", "PEMELIHARAAN", "K3", "KEUANGAN", "SDM", "LOGISTIK", "ENJINIRING", "UMUM", "KONTRAKTOR"]
+COMPANIES = ["PT MAJU JAYA", "CV SINAR TEKNIK", "PT ANDALAN", "PT SEJAHTERA MANDIRI"]
+
+
+class TrafficConfig:
+    def __init__(
+        self,
+        headcount: int = 2000,
+        days: int = 2,
+        visitors_per_day: int = 80,
+        seed: int = 42,
+        end: Optional[datetime.datetime] = None,
+        in_devices: Optional[List[str]] = None,
+        out_devices: Optional[List[str]] = None,
+        duplicate_rate: float = 0.08,
+        missing_out_rate: float = 0.03,
+        unknown_device_rate: float = 0.01,
+    ):
+        self.headcount = headcount
+        self.days = days
+        self.visitors_per_day = visitors_per_day
+        self.seed = seed
+        # Default: akhir hari ini, jadi jumlah event tidak bergantung jam benchmark dijalankan
+        # (EventFetcher membaca kemarin s/d besok, event "nanti" hari ini tetap ikut terbaca)
+        self.end = end or datetime.datetime.combine(datetime.date.today(), datetime.time.max).replace(microsecond=0)
+        # Penamaan mengikuti .env.example (zona merah: device biasa + -READER)
+        self.in_devices = in_devices or ["IN-GATE-1", "GATE-IN-POS-9", "POS-SCC-1-READER", "POS-SCC-3-READER"]
+        self.out_devices = out_devices or ["OUT-GATE-1", "GATE-OUT-POS-9", "POS-SCC-2-READER", "POS-SCC-4-READER"]
+        self.duplicate_rate = duplicate_rate
+        self.missing_out_rate = missing_out_rate
+        self.unknown_device_rate = unknown_device_rate
+
+    def as_dict(self) -> dict:
+        return {
+            "headcount": self.headcount,
+            "days": self.days,
+            "visitors_per_day": self.visitors_per_day,
+            "seed": self.seed,
+            "end": self.end.isoformat(),
+            "in_devices": self.in_devices,
+            "out_devices": self.out_devices,
+            "duplicate_rate": self.duplicate_rate,
+            "missing_out_rate": self.missing_out_rate,
+            "unknown_device_rate": self.unknown_device_rate,
+        }
+
+
+class TrafficData:
+    """Baris per tabel (tuple sesuai urutan kolom di schema.sql)."""
+
+    def __init__(self, config: TrafficConfig):
+        self.config = config
+        self.departments: List[tuple] = []
+        self.persons: List[tuple] = []
+        self.cars: List[tuple] = []
+        self.attributes: List[tuple] = []
+        self.attribute_ext: List[tuple] = []
+        self.events: List[tuple] = []  # acc_transaction, urut (event_time, id)
+        self.firstin_lastout: List[tuple] = []
+        self.visitors_lastaddr: List[tuple] = []
+        self.vis_transactions: List[tuple] = []
+
+    def tables(self) -> Dict[str, List[tuple]]:
+        return {
+            "auth_department": self.departments,
+            "pers_person": self.persons,
+            "park_car_number": self.cars,
+            "pers_attribute": self.attributes,
+            "pers_attribute_ext": self.attribute_ext,
+            "acc_transaction": self.events,
+            "acc_firstin_lastout": self.firstin_lastout,
+            "vis_visitor_lastaddr": self.visitors_lastaddr,
+            "vis_transaction": self.vis_transactions,
+        }
+
+    def event_records(self, since: Optional[datetime.datetime] = None) -> List[EventRecord]:
+        """acc_transaction sebagai EventRecord urut terbaru dulu, seperti fetch_combined_events."""
+        records = [
+            EventRecord(
+                id=row[0], pin=row[1], name=row[2], dept_name=row[3], dev_alias=row[4],
+                event_point_name=row[5], event_time=row[6], ts=int(row[6].timestamp()),
+            )
+            for row in self.events
+            if since is None or row[6] >= since
+        ]
+        records.reverse()
+        return records
+
+    def visitor_records(self) -> List[EventRecord]:
+        detail = {row[1]: row for row in self.vis_transactions}
+        records = []
+        for pin, name, dev_alias, point, event_time in self.visitors_lastaddr:
+            vis = detail.get(pin)
+            records.append(EventRecord(
+                pin=pin, name=name, dev_alias=dev_alias, event_point_name=point, event_time=event_time,
+                dept_name="VISITOR", label="visitor",
+                company=vis[2] if vis else None,
+                visit_reason=vis[3] if vis else None,
+                host={"name": vis[5], "department": vis[4]} if vis else None,
+            ))
+        return records
+
+
+def _device_columns(device: str, panel: str) -> Tuple[str, str]:
+    """(dev_alias, event_point_name) seperti yang ditulis controller ZKBio."""
+    if device.upper().endswith("-READER"):
+        return panel, device[: -len("-READER")]
+    return device, device
+
+
+def generate(config: TrafficConfig) -> TrafficData:
+    rng = random.Random(config.seed)
+    data = TrafficData(config)
+
+    for i, dept in enumerate(DEPARTMENTS):
+        data.departments.append((f"D{i:03d}", f"{i + 1:02d}", dept))
+
+    data.attributes.append(("A001", "NIPEG", 1))
+    data.attributes.append(("A002", "JABATAN", 2))
+
+    shift_names = list(SHIFTS)
+    shift_weights = [SHIFTS[s][2] for s in shift_names]
+    people = []
+    for i in range(config.headcount):
+        person_id = f"P{i:07d}"
+        pin = str(10000000 + i)
+        name = f"PEGAWAI {i:05d}"
+        dept_idx = rng.randrange(len(DEPARTMENTS))
+        gender = rng.choice("MF")
+        data.persons.append((person_id, pin, name, gender, f"D{dept_idx:03d}"))
+        if rng.random() < 0.4:
+            data.cars.append((f"C{i:07d}", person_id, f"N {rng.randint(1000, 9999)} {rng.choice('ABCDEFGH')}{rng.choice('XYZ')}"))
+        data.attribute_ext.append((
+            f"E{i:07d}", f"{rng.randint(7000000, 9999999)}{rng.choice('ZKP')}", rng.choice(["STAF", "SPV", "MANAJER", "TEKNISI"]),
+            None, None, None, person_id,
+        ))
+        people.append((pin, name, DEPARTMENTS[dept_idx], rng.choices(shift_names, shift_weights)[0]))
+
+    in_devices = config.in_devices
+    out_devices = config.out_devices
+    unknown_devices = ["POS-LAMA", "GATE-PROYEK"]
+    events = []
+
+    def swipe(when: datetime.datetime, pin: str, name: str, dept: str, devices: List[str]):
+        if when > config.end:
+            return
+        if rng.random() < config.unknown_device_rate:
+            dev_alias, point = rng.choice(unknown_devices), ""
+        else:
+            dev_alias, point = _device_columns(rng.choice(devices), f"PANEL-SCC-{rng.randint(1, 4)}")
+        events.append([pin, name, dept, dev_alias, point, when + datetime.timedelta(microseconds=rng.choice((0, 0, rng.randint(1, 999999))))])
+        if rng.random() < config.duplicate_rate:
+            events.append([pin, name, dept, dev_alias, point, when + datetime.timedelta(seconds=rng.randint(2, 90))])
+
+    start_day = (config.end - datetime.timedelta(days=config.days - 1)).date()
+    # Mulai sehari lebih awal agar shift malam sebelum jendela ikut terbawa
+    for d in range(-1, config.days):
+        day = datetime.datetime.combine(start_day + datetime.timedelta(days=d), datetime.time.min)
+        for pin, name, dept, shift in people:
+            if rng.random() < 0.08:  # cuti / libur
+                continue
+            start_hour, hours, _ = SHIFTS[shift]
+            t_in = day + datetime.timedelta(hours=start_hour, minutes=rng.gauss(0, 20))
+            t_out = t_in + datetime.timedelta(hours=hours, minutes=rng.gauss(0, 30))
+            swipe(t_in, pin, name, dept, in_devices)
+            if shift == "kantor" and rng.random() < 0.5:
+                lunch = day + datetime.timedelta(hours=12, minutes=rng.randint(0, 40))
+                swipe(lunch, pin, name, dept, out_devices)
+                swipe(lunch + datetime.timedelta(minutes=rng.randint(20, 70)), pin, name, dept, in_devices)
+            if rng.random() >= config.missing_out_rate:
+                swipe(t_out, pin, name, dept, out_devices)
+
+    window_start = datetime.datetime.combine(start_day, datetime.time.min)
+    events = [e for e in events if e[5] >= window_start]
+    events.sort(key=lambda e: e[5])
+    for n, (pin, name, dept, dev_alias, point, when) in enumerate(events):
+        data.events.append((f"{n:012d}", pin, name, dept, dev_alias, point, when, when))
+
+    # Ringkasan first-in / last-out per pin per hari (sumber export)
+    in_names = {d.replace("-READER", "") for d in in_devices}
+    daily = {}
+    for row in data.events:
+        entry = daily.setdefault((row[1], row[6].date()), [row, None, None])
+        if row[4] in in_names or row[5] in in_names:
+            entry[1] = entry[1] or row
+        else:
+            entry[2] = row
+    for n, (first, first_in, last_out) in enumerate(daily.values()):
+        data.firstin_lastout.append((
+            f"F{n:09d}", first[1], first[2], first[3],
+            first_in[6] if first_in else None, last_out[6] if last_out else None,
+            first_in[5] if first_in else None, last_out[5] if last_out else None,
+            (last_out or first)[6],
+        ))
+
+    # Visitor hari ini
+    today = datetime.datetime.combine(config.end.date(), datetime.time.min)
+    for v in range(config.visitors_per_day):
+        pin = f"V{config.end:%m%d}{v:04d}"
+        t_in = today + datetime.timedelta(hours=rng.uniform(8, 15))
+        t_out = t_in + datetime.timedelta(hours=rng.uniform(0.5, 3))
+        last, devices = (t_out, out_devices) if t_out <= config.end and rng.random() < 0.7 else (t_in, in_devices)
+        if last > config.end:
+            continue
+        dev_alias, point = _device_columns(rng.choice(devices), "PANEL-SCC-1")
+        data.visitors_lastaddr.append((pin, f"TAMU {v:04d}", dev_alias, point, last))
+        host = people[rng.randrange(len(people))] if people else ("", "", "", "")
+        data.vis_transactions.append((
+            f"T{v:07d}", pin, rng.choice(COMPANIES), rng.choice(["RAPAT", "SURVEI", "PERBAIKAN", "PENGIRIMAN"]),
+            host[2], host[1], t_in,
+        ))
+
+    return data
@@ -0,0 +1,90 @@
+-- Skema minimal database ZKBio yang dibaca aplikasi, untuk benchmark di Postgres lokal.
+-- Hanya kolom yang dipakai kode; tipe mengikuti data asli (id varchar).
+-- Jalankan lewat: python -m benchmarks.fixture --dsn postgresql://...
+
+DROP TABLE IF EXISTS acc_transaction, acc_firstin_lastout, pers_person, auth_department,
+    park_car_number, pers_attribute, pers_attribute_ext, vis_visitor_lastaddr, vis_transaction CASCADE;
+
+CREATE TABLE auth_department (
+    id          VARCHAR(50) PRIMARY KEY,
+    code        VARCHAR(50) NOT NULL,
+    name        VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE pers_person (
+    id              VARCHAR(50) PRIMARY KEY,
+    pin             VARCHAR(30) NOT NULL UNIQUE,
+    name            VARCHAR(100),
+    gender          CHAR(1),
+    auth_dept_id    VARCHAR(50) REFERENCES auth_department (id)
+);
+
+CREATE TABLE park_car_number (
+    id          VARCHAR(50) PRIMARY KEY,
+    person_id   VARCHAR(50) NOT NULL,
+    car_number  VARCHAR(20)
+);
+CREATE INDEX park_car_number_person_idx ON park_car_number (person_id);
+
+CREATE TABLE pers_attribute (
+    id          VARCHAR(50) PRIMARY KEY,
+    attr_name   VARCHAR(50) NOT NULL,
+    filed_index INTEGER NOT NULL
+);
+
+-- PersonDetailFetcher membaca SELECT * lalu mengambil kolom ke-filed_index,
+-- jadi attr_valueN harus berada di posisi N (id di posisi 0, person_id paling akhir).
+CREATE TABLE pers_attribute_ext (
+    id              VARCHAR(50) PRIMARY KEY,
+    attr_value1     VARCHAR(100),
+    attr_value2     VARCHAR(100),
+    attr_value3     VARCHAR(100),
+    attr_value4     VARCHAR(100),
+    attr_value5     VARCHAR(100),
+    person_id       VARCHAR(50) NOT NULL
+);
+CREATE INDEX pers_attribute_ext_person_idx ON pers_attribute_ext (person_id);
+
+CREATE TABLE acc_transaction (
+    id                  VARCHAR(50) PRIMARY KEY,
+    pin                 VARCHAR(30),
+    name                VARCHAR(100),
+    dept_name           VARCHAR(100),
+    dev_alias           VARCHAR(100),
+    event_point_name    VARCHAR(100),
+    event_time          TIMESTAMP NOT NULL,
+    update_time         TIMESTAMP
+);
+CREATE INDEX acc_transaction_time_idx ON acc_transaction (event_time, id);
+
+CREATE TABLE acc_firstin_lastout (
+    id                  VARCHAR(50) PRIMARY KEY,
+    pin                 VARCHAR(30),
+    name                VARCHAR(100),
+    dept_name           VARCHAR(100),
+    first_in_time       TIMESTAMP,
+    last_out_time       TIMESTAMP,
+    reader_name_in      VARCHAR(100),
+    reader_name_out     VARCHAR(100),
+    update_time         TIMESTAMP
+);
+CREATE INDEX acc_firstin_lastout_update_idx ON acc_firstin_lastout (update_time);
+
+CREATE TABLE vis_visitor_lastaddr (
+    pin                 VARCHAR(30) PRIMARY KEY,
+    name                VARCHAR(100),
+    dev_alias           VARCHAR(100),
+    event_point_name    VARCHAR(100),
+    event_time          TIMESTAMP
+);
+
+CREATE TABLE vis_transaction (
+    id                  VARCHAR(50) PRIMARY KEY,
+    vis_emp_pin         VARCHAR(30),
+    vis_company         VARCHAR(100),
+    visit_reason        VARCHAR(200),
+    visited_emp_dept    VARCHAR(100),
+    visited_emp_name    VARCHAR(100),
+    update_time         TIMESTAMP
+);
+CREATE INDEX vis_transaction_pin_idx ON vis_transaction (vis_emp_pin, update_time);
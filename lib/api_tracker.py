@@ -3,8 +3,10 @@ import sys
 import logging
 from dotenv import load_dotenv
 
+from lib.device_map import ZoneRouter
 from lib.event_fetcher import EventFetcher  
-from lib.event_processor import EventProcessor
+from lib.event_processor import EventProcessor, IncrementalEventProcessor
+from lib.metrics import count_rows, stage
 from lib.summary_builder import SummaryBuilder
 from lib.visitor_fetcher import VisitorFetcher, enrich_visitor_details
 
@@ -27,8 +29,16 @@ EMPTY_SUMMARY = {
 }
 
 
+async def process_tick(processor, fetcher, all_events, visitor_events):
+    """(per_person, pin berubah); pin berubah None berarti semua pin diproses ulang."""
+    if isinstance(processor, IncrementalEventProcessor) and fetcher.incremental:
+        return await processor.process_incremental(fetcher, visitor_events)
+    return await processor.process_events(all_events), None
+
+
 class AsyncApiTracker:
-    def __init__(self, in_devices=None, out_devices=None):
+    def __init__(self, in_devices=None, out_devices=None, fetcher=None, pool=None, processor=None, zone="default"):
+        self.zone = zone  # label metric per tahap
         self.in_devices = set(d.strip().lower() for d in in_devices or [])
         self.out_devices = set(d.strip().lower() for d in out_devices or [])
         self.db_dsn = os.getenv("DATABASE_URL")
@@ -36,36 +46,141 @@ class AsyncApiTracker:
             log.warning("[AsyncApiTracker] DATABASE_URL environment variable not set!")
 
         # === Inisialisasi semua komponen utama ===
-        self.fetcher = EventFetcher(dsn=self.db_dsn)
-        self.visitor_fetcher = VisitorFetcher(self.db_dsn)
-        self.processor = EventProcessor(self.in_devices, self.out_devices)
-        self.summary_builder = SummaryBuilder(self.db_dsn)
+        # fetcher bisa dibawa dari luar agar state incremental bertahan antar tick
+        self.pool = pool
+        self.fetcher = fetcher or EventFetcher(dsn=self.db_dsn, pool=pool)
+        self.visitor_fetcher = VisitorFetcher(self.db_dsn, pool=pool)
+        # processor incremental juga dibawa dari luar (state per pin antar tick)
+        self.processor = processor or EventProcessor(self.in_devices, self.out_devices)
+        self.summary_builder = SummaryBuilder(self.db_dsn, pool=pool)
 
     async def run(self):
         try:
+            zone = self.zone
             # Ambil data kehadiran 2 hari terakhir, urut terbaru dulu
-            events = await self.fetcher.fetch_combined_events(order='desc')
+            with stage(zone, "fetch"):
+                events = await self.fetcher.fetch_combined_events(order='desc')
             if self.fetcher.api_offline:
                 log.warning("[AsyncApiTracker] DB offline — returning EMPTY_SUMMARY")
                 return EMPTY_SUMMARY.copy()
+            count_rows(zone, "events", len(self.fetcher.last_new_events) if self.fetcher.incremental else len(events))
 
             # Ambil visitor events & enrich
-            visitor_events = await self.visitor_fetcher.fetch_events()
+            with stage(zone, "visitors"):
+                visitor_events = await self.visitor_fetcher.fetch_events()
             log.info(f"[AsyncApiTracker] Visitor events fetched: {len(visitor_events)}")
+            count_rows(zone, "visitors", len(visitor_events))
 
-            visitor_events = await enrich_visitor_details(self.db_dsn, visitor_events)
+            with stage(zone, "enrich"):
+                visitor_events = await enrich_visitor_details(self.db_dsn, visitor_events, pool=self.pool)
 
             # Gabungkan semua events (karyawan + visitor)
             all_events = events + visitor_events
             log.info(f"[AsyncApiTracker] Total combined events (events + visitors): {len(all_events)}")
 
-            # Proses semua events jadi per-person status
-            per_person = await self.processor.process_events(all_events)
+            # Proses semua events jadi per-person status (incremental: hanya event baru)
+            with stage(zone, "process"):
+                per_person, _ = await process_tick(self.processor, self.fetcher, all_events, visitor_events)
+            count_rows(zone, "persons", len(per_person))
 
             # Bangun ringkasan akhir
-            summary = await self.summary_builder.build(per_person)
+            with stage(zone, "details"):
+                summary = await self.summary_builder.build(per_person)
             return summary
 
         except Exception as e:
             log.exception(f"[AsyncApiTracker] Unexpected error: {e}")
             return EMPTY_SUMMARY.copy()
+
+
+class MultiZoneTracker:
+    """
+    Satu fetch per tick untuk semua zona: acc_transaction, vis_visitor_lastaddr dan
+    vis_transaction diambil sekali, dibagi per zona oleh ZoneRouter dalam satu lintasan,
+    lalu tiap EventProcessor hanya memproses event device zonanya sendiri.
+    """
+
+    def __init__(self, zones: dict, fetcher=None, pool=None):
+        # zones: {"hijau": (in_devices, out_devices), ...}
+        self.db_dsn = os.getenv("DATABASE_URL")
+        if not self.db_dsn:
+            log.warning("[MultiZoneTracker] DATABASE_URL environment variable not set!")
+
+        self.pool = pool
+        self.fetcher = fetcher or EventFetcher(dsn=self.db_dsn, pool=pool)
+        self.visitor_fetcher = VisitorFetcher(self.db_dsn, pool=pool)
+        # Tracker ini dipakai ulang antar tick; dengan fetcher incremental processor ikut incremental
+        processor_cls = IncrementalEventProcessor if self.fetcher.incremental else EventProcessor
+        self.processors = {
+            zone: processor_cls(
+                set(d.strip().lower() for d in in_devices or []),
+                set(d.strip().lower() for d in out_devices or []),
+            )
+            for zone, (in_devices, out_devices) in zones.items()
+        }
+        self.router = ZoneRouter({zone: processor.devices for zone, processor in self.processors.items()})
+        # Satu SummaryBuilder → cache detail person dipakai bersama semua zona
+        self.summary_builder = SummaryBuilder(self.db_dsn, pool=pool)
+
+    def _offline_all(self) -> dict:
+        return {zone: EMPTY_SUMMARY.copy() for zone in self.processors}
+
+    async def run(self) -> dict:
+        try:
+            # Tahap fetch dipakai bersama semua zona → label zone="shared"
+            with stage("shared", "fetch"):
+                events = await self.fetcher.fetch_combined_events(order='desc')
+            if self.fetcher.api_offline:
+                log.warning("[MultiZoneTracker] DB offline — returning EMPTY_SUMMARY")
+                return self._offline_all()
+            count_rows("shared", "events", len(self.fetcher.last_new_events) if self.fetcher.incremental else len(events))
+
+            with stage("shared", "visitors"):
+                visitor_events = await self.visitor_fetcher.fetch_events()
+            count_rows("shared", "visitors", len(visitor_events))
+            with stage("shared", "enrich"):
+                visitor_events = await enrich_visitor_details(self.db_dsn, visitor_events, pool=self.pool)
+
+            incremental = self.fetcher.incremental and all(
+                isinstance(p, IncrementalEventProcessor) for p in self.processors.values()
+            )
+            self.router.unknown_devices.clear()
+            with stage("shared", "route"):
+                zone_visitors = self.router.split(visitor_events)
+                if incremental:
+                    # Jendela penuh hanya dibagi jika ada processor yang harus dibangun ulang
+                    zone_new = self.router.split(self.fetcher.last_new_events)
+                    rebuild = any(p.needs_rebuild(self.fetcher) for p in self.processors.values())
+                    if not rebuild:
+                        zone_window = {}
+                    elif self.fetcher.last_new_events is self.fetcher.window:
+                        zone_window = zone_new  # reload penuh: event baru = seluruh jendela
+                    else:
+                        zone_window = self.router.split(self.fetcher.window)
+                else:
+                    zone_events = self.router.split(events)
+            if self.router.unknown_devices:
+                log.warning(f"[MultiZoneTracker] Unknown devices: {', '.join(sorted(self.router.unknown_devices))}")
+            log.info(
+                f"[MultiZoneTracker] Total combined events (events + visitors): {len(events) + len(visitor_events)} "
+                f"for {len(self.processors)} zones"
+            )
+
+            summaries = {}
+            for zone, processor in self.processors.items():
+                with stage(zone, "process"):
+                    if incremental:
+                        per_person, _ = await processor.process_incremental(
+                            self.fetcher, zone_visitors[zone],
+                            window=zone_window.get(zone), new_events=zone_new[zone],
+                        )
+                    else:
+                        per_person = await processor.process_events(zone_events[zone] + zone_visitors[zone])
+                count_rows(zone, "persons", len(per_person))
+                with stage(zone, "details"):
+                    summaries[zone] = await self.summary_builder.build(per_person)
+            return summaries
+
+        except Exception as e:
+            log.exception(f"[MultiZoneTracker] Unexpected error: {e}")
+            return self._offline_all()
@@ -0,0 +1,195 @@
+import logging
+from typing import Dict, List
+
+import numpy as np
+
+from lib.event_processor import EventProcessor, PersonState
+from lib.event_record import as_record
+
+log = logging.getLogger("api_tracker")
+
+TYPE_OUT = 0
+TYPE_IN = 1
+
+
+class EventBatch:
+    """
+    Event dalam bentuk kolom (urutan input dipertahankan): kode pin, kode atribut,
+    tipe (1=in, 0=out) dan timestamp int64. String pin dan atribut person
+    (dept, nama, visitor) hanya disimpan sekali di tabel pins/attrs.
+    """
+
+    __slots__ = ("pins", "attrs", "pin_codes", "attr_codes", "types", "ts")
+
+    def __init__(self, pins: List[str], attrs: List[dict], pin_codes, attr_codes, types, ts):
+        self.pins = pins
+        self.attrs = attrs
+        self.pin_codes = np.asarray(pin_codes, dtype=np.int32)
+        self.attr_codes = np.asarray(attr_codes, dtype=np.int32)
+        self.types = np.asarray(types, dtype=np.int8)
+        self.ts = np.asarray(ts, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def subset(self, mask) -> "EventBatch":
+        """
+        Sebagian event (mask boolean / index). Tabel pins/attrs dipadatkan ke entri yang dipakai
+        (kode dipetakan ulang, urutan relatif tetap), jadi shard yang dikirim ke proses worker
+        hanya mem-pickle pin/atributnya sendiri, bukan seluruh tabel.
+        """
+        used_pins, pin_codes = np.unique(self.pin_codes[mask], return_inverse=True)
+        used_attrs, attr_codes = np.unique(self.attr_codes[mask], return_inverse=True)
+        return EventBatch(
+            [self.pins[code] for code in used_pins.tolist()],
+            [self.attrs[code] for code in used_attrs.tolist()],
+            pin_codes, attr_codes, self.types[mask], self.ts[mask],
+        )
+
+    @classmethod
+    def from_events(cls, processor: EventProcessor, events: List[dict], unknown_devices: set) -> "EventBatch":
+        builder = BatchBuilder(processor, unknown_devices)
+        builder.extend(events)
+        return builder.build()
+
+
+class BatchBuilder:
+    """
+    Isi EventBatch bertahap (misal per halaman hasil fetch) agar dict event tidak perlu
+    ditahan semua di memori. Klasifikasi dan filter sama dengan process_events.
+    """
+
+    def __init__(self, processor: EventProcessor, unknown_devices: set):
+        self.processor = processor
+        self.unknown_devices = unknown_devices
+        self.pin_index = {}
+        self.attr_index = {}
+        self.pins = []
+        self.attrs = []
+        self.pin_codes = []
+        self.attr_codes = []
+        self.types = []
+        self.ts = []
+
+    def extend(self, events: List[dict]):
+        parse = self.processor._parse_event
+        for e in map(as_record, events):
+            parsed = parse(e, self.unknown_devices)
+            if parsed is None:
+                continue
+            pin, ev_type, ts = parsed
+
+            code = self.pin_index.get(pin)
+            if code is None:
+                code = self.pin_index[pin] = len(self.pins)
+                self.pins.append(pin)
+
+            host = e.host
+            attr_key = (
+                e.dept_name, e.name, e.label, e.company, e.visit_reason,
+                tuple(host.items()) if isinstance(host, dict) else host,
+            )
+            attr_code = self.attr_index.get(attr_key)
+            if attr_code is None:
+                attr_code = self.attr_index[attr_key] = len(self.attrs)
+                self.attrs.append(self.processor._person_attrs(e))
+
+            self.pin_codes.append(code)
+            self.attr_codes.append(attr_code)
+            self.types.append(TYPE_IN if ev_type == "in" else TYPE_OUT)
+            self.ts.append(ts)
+
+    def build(self) -> EventBatch:
+        return EventBatch(self.pins, self.attrs, self.pin_codes, self.attr_codes, self.types, self.ts)
+
+
+def fold_batch(processor: EventProcessor, batch: EventBatch) -> Dict[str, dict]:
+    """
+    Mesin inside/outside untuk semua pin sekaligus. Setelah lexsort stabil (pin, ts),
+    sebuah event mengubah status tepat jika tipenya berbeda dari event sebelumnya
+    di pin yang sama (awal segmen dianggap "out"), karena event yang diabaikan selalu
+    bertipe sama dengan status terakhir. Hasil urut kemunculan pertama pin di input
+    (belum diurutkan last_ts, lihat process_batch).
+    """
+    if not len(batch):
+        return {}
+
+    # Kemunculan pertama tiap pin menentukan urutan awal dan atributnya (sama dengan path dict)
+    first_pins, first_idx = np.unique(batch.pin_codes, return_index=True)
+    appearance = first_idx.argsort(kind="stable")
+    first_pins = first_pins[appearance].tolist()
+    first_attrs = batch.attr_codes[first_idx[appearance]].tolist()
+
+    order = np.lexsort((batch.ts, batch.pin_codes))  # stabil: ts kembar tetap urut input
+    pins = batch.pin_codes[order]
+    types = batch.types[order]
+    ts = batch.ts[order]
+
+    starts = np.empty(len(pins), dtype=bool)
+    starts[0] = True
+    np.not_equal(pins[1:], pins[:-1], out=starts[1:])
+
+    prev_types = np.empty_like(types)
+    prev_types[0] = TYPE_OUT
+    prev_types[1:] = types[:-1]
+    prev_types[starts] = TYPE_OUT
+    keep = types != prev_types
+
+    n_pins = len(batch.pins)
+    kept_in = keep & (types == TYPE_IN)
+    logical_in = np.bincount(pins[kept_in], minlength=n_pins)
+    logical_out = np.bincount(pins[keep & (types == TYPE_OUT)], minlength=n_pins)
+
+    # Event terakhir per pin (ts terbesar) dan event berubah-status terakhir per pin
+    ends = np.append(np.nonzero(starts)[0][1:] - 1, len(pins) - 1)
+    last_ts = np.zeros(n_pins, dtype=np.int64)
+    last_ts[pins[ends]] = ts[ends]
+    last_type = np.full(n_pins, TYPE_OUT, dtype=np.int8)
+    last_type[pins[ends]] = types[ends]
+
+    kept_idx = np.nonzero(keep)[0]
+    last_changed = np.zeros(n_pins, dtype=np.int64)
+    last_changed[pins[kept_idx]] = ts[kept_idx]  # index naik → nilai terakhir per pin yang tersisa
+    last_in_ts = np.zeros(n_pins, dtype=np.int64)
+    kept_in_idx = np.nonzero(kept_in)[0]
+    last_in_ts[pins[kept_in_idx]] = ts[kept_in_idx]
+
+    # Rincian event berubah-status per pin (output sama dengan path dict)
+    kept_pins = pins[kept_idx].tolist()
+    kept_types = types[kept_idx].tolist()
+    kept_ts = ts[kept_idx].tolist()
+    events_by_pin = {}
+    for code, ev_type, ev_ts in zip(kept_pins, kept_types, kept_ts):
+        events_by_pin.setdefault(code, []).append((ev_ts, "in" if ev_type == TYPE_IN else "out"))
+
+    li = logical_in.tolist()
+    lo = logical_out.tolist()
+    lt = last_ts.tolist()
+    lc = last_changed.tolist()
+    lin = last_in_ts.tolist()
+    ltype = last_type.tolist()
+
+    result = {}
+    for code, attr_code in zip(first_pins, first_attrs):
+        if code not in events_by_pin:
+            continue
+        state = PersonState()
+        state.status = "inside" if ltype[code] == TYPE_IN else "outside"
+        state.logical_in = li[code]
+        state.logical_out = lo[code]
+        state.current = li[code] - lo[code]
+        state.last_changed = lc[code]
+        state.last_ts = lt[code]
+        state.last_in_ts = lin[code] if li[code] else None
+        state.events = events_by_pin[code]
+        result[batch.pins[code]] = processor._person_result(batch.attrs[attr_code], state)
+    return result
+
+
+def process_batch(processor: EventProcessor, events: List[dict]) -> Dict[str, dict]:
+    """Versi vektor dari EventProcessor.process_events (tanpa prev_events), hasil identik."""
+    unknown_devices = set()
+    batch = EventBatch.from_events(processor, events, unknown_devices)
+    result = fold_batch(processor, batch)
+    processor._log_result(result, unknown_devices)
+    return processor._sort_result(result)
@@ -0,0 +1,156 @@
+import os
+import json
+import asyncio
+import asyncpg
+import logging
+from typing import Optional
+
+from lib.detail_cache import DetailCache, attribute_cache, person_cache
+
+log = logging.getLogger("api_tracker")
+
+CHANNEL = "person_detail_changed"
+
+# Trigger NOTIFY untuk tabel sumber detail person. Payload JSON: {"table", "pin"}.
+# Baris dibaca lewat to_jsonb() supaya satu fungsi bisa dipakai semua tabel.
+TRIGGER_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION notify_person_detail_changed() RETURNS trigger AS $$
+DECLARE
+    rec JSONB;
+    old_rec JSONB;
+    person_pin TEXT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+
+    IF TG_TABLE_NAME = 'pers_attribute' THEN
+        -- filed_index berubah: semua detail yang memakai atribut custom ikut basi
+        PERFORM pg_notify('{CHANNEL}', json_build_object('table', TG_TABLE_NAME)::text);
+        RETURN NULL;
+    END IF;
+
+    IF TG_TABLE_NAME = 'pers_person' THEN
+        person_pin := rec->>'pin';
+        IF TG_OP = 'UPDATE' THEN
+            old_rec := to_jsonb(OLD);
+            IF old_rec->>'pin' IS DISTINCT FROM person_pin THEN
+                PERFORM pg_notify('{CHANNEL}', json_build_object('table', TG_TABLE_NAME, 'pin', old_rec->>'pin')::text);
+            END IF;
+        END IF;
+    ELSE
+        SELECT p.pin INTO person_pin FROM pers_person p WHERE p.id::text = rec->>'person_id';
+    END IF;
+
+    IF person_pin IS NOT NULL THEN
+        PERFORM pg_notify('{CHANNEL}', json_build_object('table', TG_TABLE_NAME, 'pin', person_pin)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+WATCHED_TABLES = ("pers_person", "pers_attribute_ext", "park_car_number", "pers_attribute")
+
+
+async def install_triggers(conn: asyncpg.Connection):
+    """Pasang (atau pasang ulang) fungsi dan trigger NOTIFY di semua tabel sumber detail."""
+    async with conn.transaction():
+        await conn.execute(TRIGGER_FUNCTION)
+        for table in WATCHED_TABLES:
+            trigger = f"{table}_detail_notify"
+            await conn.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+            await conn.execute(f"""
+                CREATE TRIGGER {trigger}
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW EXECUTE PROCEDURE notify_person_detail_changed()
+            """)
+    log.info(f"[ChangeListener] Triggers installed on {', '.join(WATCHED_TABLES)}")
+
+
+class ChangeListener:
+    """
+    LISTEN di koneksi asyncpg tersendiri (bukan dari DbPool, karena koneksi LISTEN
+    tidak boleh dikembalikan ke pool) dan evict pin yang berubah dari cache detail.
+    Selama koneksi putus notifikasi bisa terlewat, jadi cache dikosongkan setiap kali
+    listener (re)connect.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        install: Optional[bool] = None,
+        cache: Optional[DetailCache] = None,
+        attr_cache: Optional[DetailCache] = None,
+    ):
+        self.dsn = dsn
+        if install is None:
+            install = os.getenv("PERSON_CHANGE_INSTALL_TRIGGERS", "0").strip().lower() in ("1", "true", "yes")
+        self.install = install
+        self.cache = cache if cache is not None else person_cache
+        self.attr_cache = attr_cache if attr_cache is not None else attribute_cache
+        self.keepalive = int(os.getenv("PERSON_CHANGE_KEEPALIVE_SEC", "60"))
+        self.notifications = 0
+
+    def _reset_caches(self):
+        self.cache.clear()
+        self.attr_cache.clear()
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.notifications += 1
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            log.warning(f"[ChangeListener] Invalid payload: {payload!r}")
+            return
+
+        if change.get("table") == "pers_attribute":
+            self._reset_caches()
+            log.info("[ChangeListener] pers_attribute changed, detail caches cleared")
+            return
+
+        pin = change.get("pin")
+        if pin and self.cache.invalidate(pin):
+            log.info(f"[ChangeListener] {change.get('table')} changed, evicted pin {pin}")
+
+    async def _listen_once(self):
+        conn = await asyncpg.connect(dsn=self.dsn)
+        try:
+            if self.install:
+                await install_triggers(conn)
+
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda c: lost.set())
+            await conn.add_listener(CHANNEL, self._on_notify)
+            self._reset_caches()
+            log.info(f"[ChangeListener] Listening on {CHANNEL}")
+
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    # Deteksi koneksi mati diam-diam (jaringan putus tanpa FIN)
+                    await conn.fetchval("SELECT 1")
+            log.warning("[ChangeListener] Connection terminated")
+        finally:
+            if not conn.is_closed():
+                try:
+                    await asyncio.wait_for(conn.close(), timeout=5)
+                except Exception:
+                    conn.terminate()
+
+    async def run(self):
+        delay = 1
+        while True:
+            try:
+                await self._listen_once()
+                delay = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"[ChangeListener] Listener error: {e}, retry in {delay}s")
+            # Selama putus cache tetap dipakai (dibatasi TTL), lalu dikosongkan saat connect lagi
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
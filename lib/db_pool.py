@@ -0,0 +1,117 @@
+import os
+import asyncio
+import asyncpg
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from lib.metrics import init_connection, track_queries
+
+log = logging.getLogger("api_tracker")
+
+
+class DbPool:
+    """
+    Satu asyncpg pool per proses worker, dibuat saat worker start dan dipakai
+    bersama oleh EventFetcher, VisitorFetcher dan SummaryBuilder.
+    Pool dibuat ulang otomatis jika health check atau koneksi gagal.
+    """
+
+    def __init__(self, dsn: str, min_size: Optional[int] = None, max_size: Optional[int] = None):
+        self.dsn = dsn
+        self.min_size = int(min_size or os.getenv("WORKER_POOL_MIN_SIZE", "1"))
+        self.max_size = int(max_size or os.getenv("WORKER_POOL_MAX_SIZE", "4"))
+        self.health_interval = int(os.getenv("WORKER_POOL_HEALTH_SEC", "30"))
+        self.pool: Optional[asyncpg.Pool] = None
+        self._owners = {}  # koneksi → pool asalnya (pool bisa diganti saat reset)
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> bool:
+        async with self._lock:
+            if self.pool is not None:
+                return True
+            try:
+                self.pool = await asyncpg.create_pool(
+                    dsn=self.dsn, min_size=self.min_size, max_size=self.max_size, init=init_connection
+                )
+                log.info(f"[DbPool] Pool ready (min={self.min_size}, max={self.max_size})")
+                return True
+            except Exception as e:
+                log.error(f"[DbPool] Failed to create pool: {e}")
+                return False
+
+    async def close(self):
+        async with self._lock:
+            if self.pool is not None:
+                try:
+                    await asyncio.wait_for(self.pool.close(), timeout=10)
+                except Exception:
+                    self.pool.terminate()
+                self.pool = None
+
+    async def reset(self):
+        """Buang pool rusak; pool baru dibuat pada acquire berikutnya."""
+        async with self._lock:
+            if self.pool is not None:
+                log.warning("[DbPool] Resetting pool")
+                self.pool.terminate()
+                self.pool = None
+
+    async def acquire_connection(self) -> asyncpg.Connection:
+        if self.pool is None and not await self.start():
+            raise ConnectionError("DB pool tidak tersedia")
+        pool = self.pool
+        if pool is None:
+            raise ConnectionError("DB pool tidak tersedia")
+        try:
+            conn = await pool.acquire()
+        except (OSError, asyncpg.InterfaceError, asyncpg.PostgresConnectionError):
+            await self.reset()
+            raise
+        self._owners[conn] = pool
+        return conn
+
+    async def release(self, conn: asyncpg.Connection):
+        pool = self._owners.pop(conn, None)
+        if pool is None or pool is not self.pool:
+            # Pool asal sudah di-reset, koneksi lama langsung ditutup
+            conn.terminate()
+            return
+        await pool.release(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        conn = await self.acquire_connection()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    async def health_check(self) -> bool:
+        try:
+            async with self.acquire() as conn:
+                await conn.fetchval("SELECT 1")
+            return True
+        except Exception as e:
+            log.warning(f"[DbPool] Health check failed: {e}")
+            await self.reset()
+            return False
+
+    async def health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.health_check()
+
+
+@asynccontextmanager
+async def connection(pool: Optional[DbPool], dsn: str):
+    """Ambil koneksi dari pool bersama jika ada, jika tidak buka koneksi langsung."""
+    if pool is not None:
+        async with pool.acquire() as conn:
+            yield conn
+    else:
+        conn = track_queries(await asyncpg.connect(dsn=dsn))
+        try:
+            yield conn
+        finally:
+            await conn.close()
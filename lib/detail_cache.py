@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+# Penanda "pin tidak ada di pers_person" agar tidak di-query ulang setiap tick
+NOT_FOUND = object()
+
+
+class DetailCache:
+    """
+    Cache LRU berukuran terbatas dengan TTL per entri, aman dipakai dari thread worker
+    dan thread waitress sekaligus. Counter hit/miss/eviction bisa dibaca lewat stats().
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key → (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _lookup(self, key: Hashable, count: bool) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._data[key]
+            self.expirations += 1
+        if count:
+            self.misses += 1
+        return None
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._lookup(key, count=True)
+
+    def __contains__(self, key: Hashable) -> bool:
+        # Tidak dihitung sebagai hit/miss (dipakai prefetch untuk cek pin yang belum ada)
+        with self._lock:
+            return self._lookup(key, count=False) is not None
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+                return True
+            return False
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# Cache detail person (per pin) dan mapping pers_attribute, satu per proses untuk semua zona
+person_cache = DetailCache(
+    maxsize=int(os.getenv("PERSON_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("PERSON_CACHE_TTL_SEC", "600")),
+)
+attribute_cache = DetailCache(
+    maxsize=16,
+    ttl=float(os.getenv("PERSON_CACHE_TTL_SEC", "600")),
+)
@@ -0,0 +1,218 @@
+import os
+import re
+import threading
+import unicodedata
+from types import MappingProxyType
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+ZONES = ("hijau", "merah")
+DIRECTIONS = ("in", "out")
+CACHE_SIZE = 4096  # batas memo per matcher, termasuk device tak dikenal
+
+
+def normalize(text: str) -> str:
+    if not text:
+        return ""
+    # Ubah ke huruf besar, hapus karakter non-alfanumerik, ubah spasi ke _
+    text = unicodedata.normalize("NFKD", text).encode("ASCII", "ignore").decode("utf-8")
+    text = text.upper()
+    text = re.sub(r"[^\w\s]", "", text)
+    text = re.sub(r"\s+", "_", text)
+    return text.strip()
+
+
+_POS_NUMBER = re.compile(r'pos[\s_\-]*([0-9]+)', re.IGNORECASE)
+_POS_LABEL = re.compile(r'pos[\s_\-]+([a-zA-Z]+)', re.IGNORECASE)
+
+
+def match_device_name(device_name: str, normalized_pos: Dict[str, str]) -> str:
+    """
+    Label POS untuk nama device: entri DEVICE_POS yang namanya terkandung di device,
+    lalu pola "POS" + angka / label; selain itu nama device apa adanya.
+    normalized_pos: {normalize(pos): pos} yang sudah dihitung sekali.
+    """
+    if not device_name:
+        return ""
+
+    norm_device_name = normalize(device_name)
+    for norm_pos, original_pos in normalized_pos.items():
+        if norm_pos in norm_device_name:
+            return original_pos
+
+    # Coba cari pola "POS" + angka
+    match_pos_number = _POS_NUMBER.search(device_name)
+    if match_pos_number:
+        return f"POS {int(match_pos_number.group(1))}"
+
+    # Cari pola "POS" + label
+    match_pos_label = _POS_LABEL.search(device_name)
+    if match_pos_label:
+        return f"POS {match_pos_label.group(1).upper()}"
+
+    # Gagal cocokkan
+    return device_name
+
+
+class DeviceInfo(NamedTuple):
+    zones: Tuple[str, ...]  # zona yang daftar devicenya cocok (bisa lebih dari satu)
+    direction: str
+    pos: str
+
+    def label(self, zone: str) -> str:
+        """Label POS jika device termasuk zona ini, selain itu string kosong (kolom export)."""
+        return self.pos if zone in self.zones else ""
+
+
+class DeviceMap:
+    """
+    Pemetaan reader → DeviceInfo(zona, arah, label POS) untuk export, dikompilasi sekali dari
+    IN/OUT_DEVICES_<ZONA> dan DEVICE_POS. Zona dicocokkan secara substring (huruf kecil) seperti
+    sebelumnya; hasil per (nama device, arah) dimemo, jadi tiap baris cukup satu lookup dict.
+    """
+
+    def __init__(self, zone_devices: Dict[Tuple[str, str], List[str]], device_pos: List[str]):
+        # zone_devices: {(zona, arah): [nama device]}
+        self.zone_devices = {
+            key: tuple(d.strip().lower() for d in devices) for key, devices in zone_devices.items()
+        }
+        self.device_pos = [p.strip() for p in device_pos if p.strip()]
+        self.normalized_pos = MappingProxyType({normalize(pos): pos for pos in self.device_pos})
+        self._memo: Dict[Tuple[str, str], DeviceInfo] = {}
+
+    @classmethod
+    def from_env(cls) -> "DeviceMap":
+        # split(",") tanpa filter: env kosong menghasilkan [""] yang cocok dengan semua device,
+        # sama seperti perilaku export sebelumnya
+        zone_devices = {
+            (zone, direction): os.getenv(f"{direction.upper()}_DEVICES_{zone.upper()}", "").split(",")
+            for zone in ZONES for direction in DIRECTIONS
+        }
+        return cls(zone_devices, os.getenv("DEVICE_POS", "").split(","))
+
+    def lookup(self, device_name: Optional[str], direction: str) -> DeviceInfo:
+        key = (device_name, direction)
+        hit = self._memo.get(key)
+        if hit is not None:
+            return hit
+
+        name = (device_name or "").lower()
+        zones = tuple(
+            zone for zone in ZONES
+            if any(d in name for d in self.zone_devices.get((zone, direction), ()))
+        )
+        # Label dihitung dari nama huruf kecil (hasil fallback ikut huruf kecil seperti sebelumnya)
+        hit = DeviceInfo(zones, direction, match_device_name(name, self.normalized_pos) if zones else "")
+
+        if len(self._memo) >= CACHE_SIZE:
+            self._memo.clear()
+        self._memo[key] = hit
+        return hit
+
+
+_device_map: Optional[DeviceMap] = None
+_device_map_lock = threading.Lock()
+
+
+def get_device_map() -> DeviceMap:
+    """DeviceMap dari .env, dibangun sekali per proses (env tidak berubah saat berjalan)."""
+    global _device_map
+    if _device_map is None:
+        with _device_map_lock:
+            if _device_map is None:
+                _device_map = DeviceMap.from_env()
+    return _device_map
+
+
+class DeviceMatcher:
+    """
+    Klasifikasi in/out satu zona untuk EventProcessor: nama device dicocokkan persis
+    (huruf besar, tanpa -READER), event_point_name dipakai jika cocok dengan device -READER.
+    Hasil per pasangan (dev_alias, event_point_name) mentah dimemo.
+    """
+
+    def __init__(self, in_devices, out_devices):
+        # Simpan semua device seperti di env
+        self.in_devices = frozenset(d.strip().upper() for d in in_devices)
+        self.out_devices = frozenset(d.strip().upper() for d in out_devices)
+
+        # Tabel lookup beku: nama device tanpa -READER → "in"/"out" (in menang jika ada di keduanya)
+        device_types = {d.replace("-READER", ""): "out" for d in self.out_devices}
+        device_types.update({d.replace("-READER", ""): "in" for d in self.in_devices})
+        self.device_types = MappingProxyType(device_types)
+
+        # event_point_name yang dipakai sebagai device jika cocok dengan device -READER di env
+        self.reader_points = frozenset(
+            d.replace("-READER", "").strip()
+            for d in self.in_devices | self.out_devices if "-READER" in d
+        )
+
+        # Memo (dev_alias, event_point_name) → (dev, type, sumber); type None = device tak dikenal
+        self._classified: Dict[tuple, Tuple[str, Optional[str], str]] = {}
+
+    def direction(self, dev_name: str) -> Optional[str]:
+        return self.device_types.get(dev_name.strip().upper())
+
+    def classify(self, dev_alias, event_point_name) -> Tuple[str, Optional[str], str]:
+        key = (dev_alias, event_point_name)
+        hit = self._classified.get(key)
+        if hit is not None:
+            return hit
+
+        dev = str(dev_alias or "").strip().upper()
+        used_from = "dev_alias"
+
+        # 🔹 Jika di env ada -READER → cocokkan event_point_name tanpa -READER
+        point = str(event_point_name or "").strip().upper()
+        if point in self.reader_points:
+            dev = point
+            used_from = "event_point_name"
+
+        hit = (dev, self.direction(dev), used_from)
+        if len(self._classified) >= CACHE_SIZE:
+            self._classified.clear()
+        self._classified[key] = hit
+        return hit
+
+
+class ZoneRouter:
+    """
+    Bagi event ke zona dalam satu lintasan (MultiZoneTracker): pasangan (dev_alias,
+    event_point_name) diklasifikasi sekali lewat DeviceMatcher tiap zona lalu dimemo, sehingga
+    EventProcessor tiap zona hanya memproses event device-nya sendiri. CPU per tick tidak lagi
+    naik sebanding jumlah zona × jumlah event.
+    """
+
+    def __init__(self, matchers: Dict[str, DeviceMatcher]):
+        self.matchers = matchers
+        self._zones: Dict[tuple, Tuple[str, ...]] = {}
+        self.unknown_devices = set()  # device yang tidak dikenal zona mana pun (dikosongkan pemanggil)
+
+    def zones_for(self, dev_alias, event_point_name) -> Tuple[str, ...]:
+        key = (dev_alias, event_point_name)
+        zones = self._zones.get(key)
+        if zones is None:
+            zones = tuple(
+                zone for zone, matcher in self.matchers.items()
+                if matcher.classify(dev_alias, event_point_name)[1] is not None
+            )
+            if len(self._zones) >= CACHE_SIZE:
+                self._zones.clear()
+            self._zones[key] = zones
+        return zones
+
+    def split(self, events) -> Dict[str, list]:
+        """{zona: [event]} dengan urutan input dipertahankan; event tanpa zona dibuang."""
+        routed = {zone: [] for zone in self.matchers}
+        unknown = set()
+        for e in events:
+            zones = self.zones_for(e.dev_alias, e.event_point_name)
+            if not zones:
+                unknown.add((e.dev_alias, e.event_point_name))
+                continue
+            for zone in zones:
+                routed[zone].append(e)
+
+        matcher = next(iter(self.matchers.values()), None)
+        if matcher:
+            self.unknown_devices.update(matcher.classify(dev_alias, point)[0].lower() for dev_alias, point in unknown)
+        return routed
@@ -1,24 +1,64 @@
+import os
 import datetime
+import time
 import asyncpg
 import logging
-from typing import List, Dict, Optional
+from operator import attrgetter
+from typing import List, Optional, Set, Tuple
+
+from lib.event_record import EventRecord
+from lib.metrics import track_queries
 
 log = logging.getLogger("db_event_fetcher")
 
+EVENT_COLUMNS = "id, pin, name, dept_name, dev_alias, event_point_name, event_time, update_time"
+
 
 class EventFetcher:
-    def __init__(self, dsn: str):
+    def __init__(self, dsn: str, incremental: bool = False, paging: Optional[str] = None, pool=None):
         self.dsn = dsn
+        self.pool = pool  # DbPool bersama (opsional)
         self.api_offline = False
         self.conn = None
 
+        # "keyset" = WHERE (event_time, id) < last_key, "offset" = OFFSET/LIMIT lama
+        self.paging = (paging or os.getenv("EVENT_FETCH_PAGING", "keyset")).strip().lower()
+
+        # Mode incremental: simpan jendela 2 hari di memori + high-water mark (event_time, id)
+        self.incremental = incremental
+        self.window: List[EventRecord] = []  # urut ASC berdasarkan (event_time, id)
+        self.window_start: Optional[datetime.datetime] = None
+        self.high_water_mark: Optional[Tuple[datetime.datetime, str]] = None
+        self.window_ids: Set[str] = set()  # id baris di jendela, untuk dedupe baca ulang lookback
+        self.loaded_at = 0.0  # time.monotonic() saat jendela terakhir dimuat penuh
+        self.last_new_events: List[EventRecord] = []
+        self.window_reset = False
+        self.generation = 0  # naik setiap fetch incremental sukses (dipakai IncrementalEventProcessor)
+
+        # Baris yang di-upload terlambat (device offline lalu sync) punya event_time di bawah
+        # high-water mark: tiap tick baca ulang LOOKBACK terakhir (dedupe per id), dan muat
+        # ulang jendela penuh tiap FULL_RELOAD detik serta saat ganti hari untuk yang lebih lama
+        self.lookback = datetime.timedelta(seconds=int(os.getenv("EVENT_FETCH_LOOKBACK_SEC", "600")))
+        self.full_reload_sec = float(os.getenv("EVENT_FETCH_FULL_RELOAD_SEC", "3600"))
+
+    @staticmethod
+    def _rows(rows) -> List[EventRecord]:
+        """Record asyncpg → EventRecord (slots, string di-intern, ts epoch sudah dihitung)."""
+        return [EventRecord.from_row(row) for row in rows]
+
     async def connect(self):
         if self.conn is None:
-            self.conn = await asyncpg.connect(dsn=self.dsn)
+            if self.pool is not None:
+                self.conn = await self.pool.acquire_connection()
+            else:
+                self.conn = track_queries(await asyncpg.connect(dsn=self.dsn))
 
     async def close(self):
         if self.conn:
-            await self.conn.close()
+            if self.pool is not None:
+                await self.pool.release(self.conn)
+            else:
+                await self.conn.close()
             self.conn = None
 
     async def fetch_range(
@@ -28,13 +68,13 @@ class EventFetcher:
         page: int = 1,
         per_page: int = 800,
         order: str = 'desc',
-    ) -> Optional[List[Dict]]:
+    ) -> Optional[List[EventRecord]]:
         await self.connect()
         offset = (page - 1) * per_page
         order_clause = 'DESC' if order.lower() == 'desc' else 'ASC'
 
         query = f"""
-            SELECT pin, name, dept_name, dev_alias, event_point_name, event_time, update_time
+            SELECT {EVENT_COLUMNS}
             FROM acc_transaction
             WHERE event_time BETWEEN $1 AND $2
             ORDER BY event_time {order_clause}
@@ -43,30 +83,145 @@ class EventFetcher:
 
         try:
             rows = await self.conn.fetch(query, start, end, offset, per_page)
-            return [dict(row) for row in rows]
+            return self._rows(rows)
         except Exception as e:
             self.api_offline = True
             log.error(f"[EventFetcher] Error fetching page {page}: {e}")
             return None
 
+    async def fetch_range_after(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        after: Optional[Tuple[datetime.datetime, str]] = None,
+        per_page: int = 800,
+        order: str = 'desc',
+    ) -> Optional[List[EventRecord]]:
+        """Satu halaman keyset: baris setelah `after` (event_time, id) sesuai arah order."""
+        await self.connect()
+        desc = order.lower() == 'desc'
+        order_clause = 'DESC' if desc else 'ASC'
+        cmp = '<' if desc else '>'
+
+        if after is None:
+            query = f"""
+                SELECT {EVENT_COLUMNS}
+                FROM acc_transaction
+                WHERE event_time BETWEEN $1 AND $2
+                ORDER BY event_time {order_clause}, id {order_clause}
+                LIMIT $3
+            """
+            args = (start, end, per_page)
+        else:
+            query = f"""
+                SELECT {EVENT_COLUMNS}
+                FROM acc_transaction
+                WHERE event_time BETWEEN $1 AND $2 AND (event_time, id) {cmp} ($3, $4)
+                ORDER BY event_time {order_clause}, id {order_clause}
+                LIMIT $5
+            """
+            args = (start, end, after[0], after[1], per_page)
+
+        try:
+            rows = await self.conn.fetch(query, *args)
+            return self._rows(rows)
+        except Exception as e:
+            self.api_offline = True
+            log.error(f"[EventFetcher] Error fetching page after {after[0] if after else start}: {e}")
+            return None
+
     async def _fetch_all(
         self,
         start: datetime.datetime,
         end: datetime.datetime,
         per_page: int = 800,
         order: str = 'desc'
-    ) -> List[Dict]:
-        page = 1
+    ) -> List[EventRecord]:
+        started = time.perf_counter()
+        pages = 0
         result = []
-        while True:
-            page_data = await self.fetch_range(start, end, page, per_page, order)
-            if not page_data:  # handle None and empty list
-                break
-            result.extend(page_data)
-            page += 1
+
+        if self.paging == "offset":
+            while True:
+                page_data = await self.fetch_range(start, end, pages + 1, per_page, order)
+                if not page_data:  # handle None and empty list
+                    break
+                result.extend(page_data)
+                pages += 1
+        else:
+            after = None
+            while True:
+                page_data = await self.fetch_range_after(start, end, after, per_page, order)
+                if page_data is None:
+                    break
+                result.extend(page_data)
+                pages += 1
+                if len(page_data) < per_page:
+                    break
+                after = self._event_key(page_data[-1])
+
+        elapsed = time.perf_counter() - started
+        if page_data is None:
+            log.warning(
+                f"[EventFetcher] Fetch {start:%Y-%m-%d} stopped at page {pages + 1}, "
+                f"partial result: {len(result)} rows"
+            )
+        rate = len(result) / elapsed if elapsed > 0 else 0.0
+        log.info(
+            f"[EventFetcher] {start:%Y-%m-%d}: {len(result)} rows in {pages} pages "
+            f"({self.paging}, {elapsed:.2f}s, {rate:.0f} rows/s)"
+        )
         return result
 
-    async def fetch_combined_events(self, order: str = 'desc') -> List[Dict]:
+    async def fetch_after(
+        self,
+        mark: Optional[Tuple[datetime.datetime, str]],
+        start: datetime.datetime,
+        end: datetime.datetime,
+        per_page: int = 800,
+    ) -> Optional[List[EventRecord]]:
+        """
+        Ambil semua baris dengan event_time < end setelah high-water mark (event_time, id),
+        urut ASC. Tanpa mark, ambil mulai dari `start`.
+        """
+        await self.connect()
+        first_query = f"""
+            SELECT {EVENT_COLUMNS}
+            FROM acc_transaction
+            WHERE event_time >= $1 AND event_time < $2
+            ORDER BY event_time ASC, id ASC
+            LIMIT $3
+        """
+        next_query = f"""
+            SELECT {EVENT_COLUMNS}
+            FROM acc_transaction
+            WHERE (event_time, id) > ($1, $2) AND event_time < $3
+            ORDER BY event_time ASC, id ASC
+            LIMIT $4
+        """
+
+        result = []
+        try:
+            if mark is None:
+                rows = await self.conn.fetch(first_query, start, end, per_page)
+            else:
+                rows = await self.conn.fetch(next_query, mark[0], mark[1], end, per_page)
+
+            while True:
+                result.extend(self._rows(rows))
+                if len(rows) < per_page:
+                    break
+                rows = await self.conn.fetch(
+                    next_query, rows[-1]["event_time"], rows[-1]["id"], end, per_page
+                )
+            return result
+        except Exception as e:
+            self.api_offline = True
+            log.error(f"[EventFetcher] Error fetching events after {mark[0] if mark else start}: {e}")
+            return None
+
+    @staticmethod
+    def _day_bounds():
         # Ambil waktu lokal dari sistem dengan timezone aware
         now = datetime.datetime.now().astimezone()
         today = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -74,22 +229,103 @@ class EventFetcher:
         tomorrow = today + datetime.timedelta(days=1)
 
         # Ubah ke offset-naive karena asyncpg dan DB tidak pakai tzinfo
-        yesterday_naive = yesterday.replace(tzinfo=None)
-        today_naive = today.replace(tzinfo=None)
-        tomorrow_naive = tomorrow.replace(tzinfo=None)
+        return (
+            yesterday.replace(tzinfo=None),
+            today.replace(tzinfo=None),
+            tomorrow.replace(tzinfo=None),
+        )
 
-        await self.connect()
+    @staticmethod
+    def _event_key(event: EventRecord):
+        return event.event_time, event.id
+
+    def _output(self, events: List[EventRecord], order: str) -> List[EventRecord]:
+        return list(reversed(events)) if order.lower() == 'desc' else list(events)
+
+    async def fetch_combined_events(self, order: str = 'desc') -> List[EventRecord]:
+        # Fetcher dipakai ulang antar tick (shared loop): status offline hanya berlaku per fetch
+        self.api_offline = False
+        if self.incremental:
+            return await self._fetch_incremental(order)
+
+        yesterday_naive, today_naive, tomorrow_naive = self._day_bounds()
 
-        events_yesterday = await self._fetch_all(yesterday_naive, today_naive, order=order)
-        events_today = await self._fetch_all(today_naive, tomorrow_naive, order=order)
+        try:
+            await self.connect()
 
-        await self.close()
+            events_yesterday = await self._fetch_all(yesterday_naive, today_naive, order=order)
+            events_today = await self._fetch_all(today_naive, tomorrow_naive, order=order)
+        finally:
+            await self.close()
 
         combined = events_yesterday + events_today
 
         # Sortir ulang sesuai order agar konsisten
         reverse = order.lower() == 'desc'
-        combined.sort(key=lambda x: x['event_time'], reverse=reverse)
+        combined.sort(key=attrgetter("event_time"), reverse=reverse)
 
         log.info(f"[EventFetcher] Total events fetched (2 hari): {len(combined)}")
         return combined
+
+    def _needs_reload(self, window_start: datetime.datetime) -> bool:
+        if self.high_water_mark is None or self.window_start != window_start:
+            return True  # run pertama, setelah DB offline, atau ganti hari
+        return self.full_reload_sec > 0 and time.monotonic() - self.loaded_at >= self.full_reload_sec
+
+    async def _fetch_incremental(self, order: str) -> List[EventRecord]:
+        """
+        Ambil baris sejak (high-water mark - lookback), buang yang id-nya sudah ada di jendela
+        2 hari di memori, lalu tambahkan sisanya. Baris terlambat (event_time di bawah mark)
+        disisipkan urut ke jendela dan ikut last_new_events, sehingga IncrementalEventProcessor
+        menghitung ulang pin-nya. Run pertama, setelah DB offline, ganti hari dan tiap
+        EVENT_FETCH_FULL_RELOAD_SEC memuat ulang jendela penuh.
+        """
+        yesterday_naive, _, tomorrow_naive = self._day_bounds()
+        self.window_reset = False
+
+        try:
+            await self.connect()
+
+            if self._needs_reload(yesterday_naive):
+                events = await self.fetch_after(None, yesterday_naive, tomorrow_naive)
+                if events is None:
+                    self.high_water_mark = None
+                    return []
+                self.window = events
+                self.window_ids = {e.id for e in events}
+                self.window_start = yesterday_naive
+                self.window_reset = True
+                self.loaded_at = time.monotonic()
+                self.last_new_events = events
+                log.info(f"[EventFetcher] Window loaded (2 hari): {len(events)}")
+            else:
+                since = max(self.high_water_mark[0] - self.lookback, yesterday_naive)
+                rows = await self.fetch_after(None, since, tomorrow_naive)
+                if rows is None:
+                    # Paksa reload penuh di tick berikutnya supaya tidak ada baris terlewat
+                    self.high_water_mark = None
+                    self.window = []
+                    self.window_ids = set()
+                    return []
+
+                new_events = [e for e in rows if e.id not in self.window_ids]
+                late = sum(1 for e in new_events if self._event_key(e) < self.high_water_mark)
+                self.window.extend(new_events)
+                self.window_ids.update(e.id for e in new_events)
+                if late:
+                    # Hampir urut → timsort linear; jendela tetap ASC untuk rebuild processor
+                    self.window.sort(key=self._event_key)
+                self.last_new_events = new_events
+
+                log.info(
+                    f"[EventFetcher] Incremental: +{len(new_events)} new ({late} late), "
+                    f"{len(rows)} rows re-read since {since:%H:%M:%S}, window={len(self.window)}"
+                )
+
+            if self.window:
+                self.high_water_mark = self._event_key(self.window[-1])
+            self.generation += 1
+
+            return self._output(self.window, order)
+        finally:
+            await self.close()
@@ -1,136 +1,243 @@
+import bisect
 import datetime
 import logging
-from typing import Optional, List, Dict
+from operator import itemgetter
+from typing import Optional, List, Dict, Tuple
+
+from lib.device_map import DeviceMatcher
+from lib.event_record import EventRecord, as_record
 
 log = logging.getLogger("api_tracker")
 
+_by_ts = itemgetter(0)
+
+
+class PersonState:
+    """State mesin inside/outside satu person, dipakai proses penuh maupun incremental."""
+
+    __slots__ = ("status", "logical_in", "logical_out", "current", "last_changed", "last_ts", "last_in_ts", "events")
+
+    def __init__(self):
+        self.status = "outside"
+        self.logical_in = 0
+        self.logical_out = 0
+        self.current = 0
+        self.last_changed = None
+        self.last_ts = None
+        self.last_in_ts = None
+        self.events = []  # (ts, type) hanya untuk event yang mengubah status
+
+    def apply(self, ev_type: str, ts: int):
+        self.last_ts = ts
+        if ev_type == "in" and self.status == "outside":
+            self.status = "inside"
+            self.logical_in += 1
+            self.current += 1
+            self.last_in_ts = ts
+        elif ev_type == "out" and self.status == "inside":
+            self.status = "outside"
+            self.logical_out += 1
+            self.current -= 1
+        else:
+            return
+        self.events.append((ts, ev_type))
+        self.last_changed = ts
+
+    def possibly_stuck(self, timeout: int) -> bool:
+        return self.status == "inside" and self.last_in_ts is not None and self.last_ts - self.last_in_ts > timeout
+
 
 class EventProcessor:
     STUCK_TIMEOUT = 12 * 3600  # 12 jam
     DUPLICATE_IN_THRESHOLD = 2 * 3600  # 2 jam
 
     def __init__(self, in_devices: set[str], out_devices: set[str]):
-        # Simpan semua device seperti di env
-        self.in_devices = {d.strip().upper() for d in in_devices}
-        self.out_devices = {d.strip().upper() for d in out_devices}
-
-        # Buat dua kategori
-        self.reader_in_devices = {d for d in self.in_devices if "-READER" in d}
-        self.reader_out_devices = {d for d in self.out_devices if "-READER" in d}
-        self.normal_in_devices = {d for d in self.in_devices if "-READER" not in d}
-        self.normal_out_devices = {d for d in self.out_devices if "-READER" not in d}
+        # Pencocokan device (lookup in/out + memo per pasangan dev_alias/event_point_name)
+        self.devices = DeviceMatcher(in_devices, out_devices)
+        self.in_devices = self.devices.in_devices
+        self.out_devices = self.devices.out_devices
 
         # 🧠 Jangan reset counter kalau sudah ada (repeat run)
         if not hasattr(self, "event_point_used_total"):
             self.event_point_used_total = 0
 
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
     @staticmethod
     def timestamp_from_str(time_str: str) -> Optional[int]:
         try:
-            dt = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-            return int(dt.timestamp())
+            # fromisoformat juga menerima detik pecahan (".123456") yang dulu membuat event hilang
+            return int(datetime.datetime.fromisoformat(time_str.strip()).timestamp())
         except Exception:
             return None
 
+    @classmethod
+    def to_timestamp(cls, value) -> Optional[int]:
+        """Epoch detik dari datetime (asyncpg), angka, atau string waktu."""
+        if isinstance(value, datetime.datetime):
+            return int(value.timestamp())
+        if isinstance(value, (int, float)):
+            return int(value)
+        if value:
+            return cls.timestamp_from_str(str(value))
+        return None
+
+    @classmethod
+    def event_timestamp(cls, e: EventRecord) -> Optional[int]:
+        # "ts" sudah diisi EventFetcher; event lain (visitor) dikonversi di sini
+        return e.ts or cls.to_timestamp(e.event_time)
+
+    @classmethod
+    def format_ts(cls, ts: Optional[int]) -> str:
+        """Format string hanya di output (last_time)."""
+        return datetime.datetime.fromtimestamp(ts).strftime(cls.TIME_FORMAT) if ts else ""
+
     def get_type_from_device(self, dev_name: str) -> Optional[str]:
         """Menentukan apakah device termasuk in atau out"""
-        dev_upper = dev_name.strip().upper()
-        if dev_upper in {d.replace("-READER", "") for d in self.in_devices}:
-            return "in"
-        if dev_upper in {d.replace("-READER", "") for d in self.out_devices}:
-            return "out"
-        return None
+        return self.devices.direction(dev_name)
+
+    def classify(self, dev_alias, event_point_name) -> Tuple[str, Optional[str], str]:
+        """
+        (dev, type, sumber) untuk pasangan dev_alias/event_point_name mentah dari event.
+        Hasil (termasuk device tak dikenal) di-memo sehingga tiap event cukup satu lookup dict.
+        """
+        return self.devices.classify(dev_alias, event_point_name)
 
-    def _prepare_prev_lookup(self, prev_events: List[dict]) -> Dict[str, List[dict]]:
+    def _prepare_prev_lookup(self, prev_events: List[EventRecord]) -> Dict[str, List[tuple]]:
         prev_lookup = {}
-        for e in prev_events:
-            pin = e.get("pin", "").strip()
-            dev = str(e.get("dev_alias") or "").strip().upper()
-            time_raw = e.get("event_time") or e.get("time")
-            time_str = str(time_raw).strip() if time_raw else ""
-            ts = self.timestamp_from_str(time_str)
+        for e in map(as_record, prev_events):
+            pin = (e.pin or "").strip()
+            dev = str(e.dev_alias or "").strip().upper()
+            ts = self.event_timestamp(e)
             ev_type = self.get_type_from_device(dev)
             if not pin or not ts or not ev_type:
                 continue
 
-            dt = datetime.datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S")
-            if dt.time() >= datetime.time(21, 0) or dt.time() <= datetime.time(12, 0):
-                prev_lookup.setdefault(pin, []).append({
-                    "type": ev_type,
-                    "ts": ts,
-                    "time": time_str
-                })
+            time_of_day = datetime.datetime.fromtimestamp(ts).time()
+            if time_of_day >= datetime.time(21, 0) or time_of_day <= datetime.time(12, 0):
+                prev_lookup.setdefault(pin, []).append((ts, ev_type))
         return prev_lookup
 
+    def _parse_event(self, e: EventRecord, unknown_devices: set) -> Optional[Tuple[str, str, int]]:
+        """(pin, type, ts) untuk event valid; None jika event dilewati."""
+        pin = (e.pin or "").strip()
+        is_visitor = e.label == "visitor"
+        dept = str(e.dept_name or ("TAMU" if is_visitor else "") or "").strip()
+
+        dev, ev_type, used_from = self.classify(e.dev_alias, e.event_point_name)
+        if used_from == "event_point_name":
+            self.event_point_used_total += 1
+
+        # timestamp (int epoch, string dibuat hanya untuk last_time)
+        ts = self.event_timestamp(e)
+        if not all([dept, pin, dev]) or not ts:
+            return None
+
+        if not ev_type:
+            unknown_devices.add(dev.lower())
+            return None
+
+        log.debug(f"[EventProcessor] {pin} → using {used_from}='{dev}' (type={ev_type})")
+        return pin, ev_type, ts
+
+    @staticmethod
+    def _person_attrs(e: EventRecord) -> dict:
+        is_visitor = e.label == "visitor"
+        return {
+            "dept": str(e.dept_name or ("TAMU" if is_visitor else "") or "").strip(),
+            "name": (e.name or "").strip(),
+            "label": "visitor" if is_visitor else None,
+            "company": e.company if is_visitor else None,
+            "visit_reason": e.visit_reason if is_visitor else None,
+            "host": e.host if is_visitor else None,
+        }
+
+    def _person_result(self, person: dict, state: PersonState) -> Optional[dict]:
+        if not state.events:
+            return None
+
+        person_result = {
+            "dept": person["dept"],
+            "name": person["name"],
+            "status": state.status,
+            "last_time": self.format_ts(state.last_changed),
+            "last_ts": state.last_changed,
+            "events": list(state.events),
+            "logical_in": state.logical_in,
+            "logical_out": state.logical_out,
+            "current": state.current,
+        }
+
+        if person.get("label") == "visitor":
+            person_result["label"] = "visitor"
+            if person.get("company"):
+                person_result["company"] = person["company"]
+            if person.get("visit_reason"):
+                person_result["visit_reason"] = person["visit_reason"]
+            if person.get("host"):
+                person_result["host"] = person["host"]
+
+        if state.possibly_stuck(self.STUCK_TIMEOUT):
+            person_result["possibly_stuck"] = True
+
+        return person_result
+
+    def _log_result(self, result: Dict[str, dict], unknown_devices: set):
+        log.info(f"[EventProcessor] Total processed people: {len(result)}")
+        visitor_count = sum(1 for v in result.values() if v.get("label") == "visitor")
+        log.info(f"[EventProcessor] Total visitors: {visitor_count}")
+        log.info(f"[EventProcessor] Total event_point_name used: {self.event_point_used_total}")
+
+        if unknown_devices:
+            log.warning(f"[EventProcessor] Unknown devices: {', '.join(sorted(unknown_devices))}")
+
+    @staticmethod
+    def _sort_result(result: Dict[str, dict]) -> Dict[str, dict]:
+        return dict(sorted(result.items(), key=lambda item: item[1]["last_ts"], reverse=True))
+
     async def process_events(
         self,
         events: List[dict],
         prev_events: Optional[List[dict]] = None
     ) -> Dict[str, dict]:
+        unknown_devices = set()
+        result = self._process(events, unknown_devices, prev_events)
+        self._log_result(result, unknown_devices)
+        return self._sort_result(result)
+
+    def _process(
+        self,
+        events: List[dict],
+        unknown_devices: set,
+        prev_events: Optional[List[dict]] = None
+    ) -> Dict[str, dict]:
 
         per_person = {}
-        unknown_devices = set()
         prev_lookup = self._prepare_prev_lookup(prev_events) if prev_events else {}
 
-        for e in events:
-            pin = e.get("pin", "").strip()
-            name = e.get("name", "").strip()
-            is_visitor = e.get("label") == "visitor"
-
-            dev_alias = str(e.get("dev_alias") or e.get("device") or "").strip().upper()
-            event_point_name = str(e.get("event_point_name") or "").strip().upper()
-            dept = str(e.get("dept_name") or e.get("department") or ("TAMU" if is_visitor else "") or "").strip()
-
-            # Default gunakan dev_alias
-            dev = dev_alias
-            used_from = "dev_alias"
-
-            # 🔹 Jika di env ada -READER → cocokkan event_point_name tanpa -READER
-            for reader_dev in (self.reader_in_devices | self.reader_out_devices):
-                base_name = reader_dev.replace("-READER", "").strip().upper()
-                if event_point_name == base_name:
-                    dev = event_point_name
-                    used_from = "event_point_name"
-                    self.event_point_used_total += 1
-                    break
-
-            # timestamp
-            time_raw = e.get("event_time") or e.get("time")
-            time_str = str(time_raw).strip() if time_raw else ""
-            ts = self.timestamp_from_str(time_str)
-            if not all([dept, pin, dev, time_str]) or not ts:
-                continue
-
-            ev_type = self.get_type_from_device(dev)
-            if not ev_type:
-                unknown_devices.add(dev.lower())
+        for e in map(as_record, events):
+            parsed = self._parse_event(e, unknown_devices)
+            if parsed is None:
                 continue
+            pin, ev_type, ts = parsed
 
-            log.debug(f"[EventProcessor] {pin} → using {used_from}='{dev}' (type={ev_type})")
-
-            person = per_person.setdefault(pin, {
-                "dept": dept,
-                "name": name,
-                "events": [],
-                "label": "visitor" if is_visitor else None,
-                "company": e.get("company") if is_visitor else None,
-                "visit_reason": e.get("visit_reason") if is_visitor else None,
-                "host": e.get("host") if is_visitor else None,
-            })
-            person["events"].append({"type": ev_type, "ts": ts, "time": time_str})
+            person = per_person.get(pin)
+            if person is None:
+                person = per_person[pin] = dict(self._person_attrs(e), events=[])
+            person["events"].append((ts, ev_type))
 
         # 🔹 Gabungkan prev_lookup
         for pin, prev_evs in prev_lookup.items():
             if pin in per_person:
                 events_list = per_person[pin]["events"]
                 for prev_ev in prev_evs:
-                    if prev_ev["type"] == "in" and not any(ev["ts"] == prev_ev["ts"] for ev in events_list):
+                    if prev_ev[1] == "in" and not any(ev[0] == prev_ev[0] for ev in events_list):
                         events_list.append(prev_ev)
-                per_person[pin]["events"] = sorted(events_list, key=lambda x: x["ts"])
+                per_person[pin]["events"] = sorted(events_list, key=_by_ts)
             else:
-                in_prev = [ev for ev in prev_evs if ev["type"] == "in"]
+                in_prev = [ev for ev in prev_evs if ev[1] == "in"]
                 if in_prev:
-                    best_in = max(in_prev, key=lambda x: x["ts"])
+                    best_in = max(in_prev, key=_by_ts)
                     per_person[pin] = {
                         "dept": "UNKNOWN",
                         "name": "",
@@ -144,78 +251,116 @@ class EventProcessor:
         # 🔹 Proses akhir
         result = {}
         for pin, person in per_person.items():
-            events_sorted = sorted(person["events"], key=lambda x: x["ts"])
-            status = "outside"
-            last_time = ""
-            filtered_events = []
-            possibly_stuck = False
-            last_ts = None
-            logical_in = 0
-            logical_out = 0
-            current = 0
-
-            for ev in events_sorted:
-                ev_type = ev["type"]
-                ts = ev["ts"]
-                time_str = ev["time"]
-                last_ts = ts
-
-                if ev_type == "in" and status == "outside":
-                    status = "inside"
-                    logical_in += 1
-                    current += 1
-                    filtered_events.append(ev)
-                    last_time = time_str
-                elif ev_type == "out" and status == "inside":
-                    status = "outside"
-                    logical_out += 1
-                    current -= 1
-                    filtered_events.append(ev)
-                    last_time = time_str
-
-            if not filtered_events:
-                continue
+            state = PersonState()
+            for ts, ev_type in sorted(person["events"], key=_by_ts):
+                state.apply(ev_type, ts)
 
-            if status == "inside" and last_ts is not None:
-                last_in_event = next((e for e in reversed(filtered_events) if e["type"] == "in"), None)
-                if last_in_event and (last_ts - last_in_event["ts"] > self.STUCK_TIMEOUT):
-                    possibly_stuck = True
-
-            person_result = {
-                "dept": person["dept"],
-                "name": person["name"],
-                "status": status,
-                "last_time": last_time,
-                "events": filtered_events,
-                "logical_in": logical_in,
-                "logical_out": logical_out,
-                "current": current,
-            }
-
-            if person.get("label") == "visitor":
-                person_result["label"] = "visitor"
-                if person.get("company"):
-                    person_result["company"] = person["company"]
-                if person.get("visit_reason"):
-                    person_result["visit_reason"] = person["visit_reason"]
-                if person.get("host"):
-                    person_result["host"] = person["host"]
-
-            if possibly_stuck:
-                person_result["possibly_stuck"] = True
-
-            result[pin] = person_result
-
-        # 🔹 Logging
-        log.info(f"[EventProcessor] Total processed people: {len(result)}")
-        visitor_count = sum(1 for v in result.values() if v.get("label") == "visitor")
-        log.info(f"[EventProcessor] Total visitors: {visitor_count}")
-        log.info(f"[EventProcessor] Total event_point_name used: {self.event_point_used_total}")
+            person_result = self._person_result(person, state)
+            if person_result is not None:
+                result[pin] = person_result
 
-        if unknown_devices:
-            log.warning(f"[EventProcessor] Unknown devices: {', '.join(sorted(unknown_devices))}")
+        return result
+
+
+class IncrementalEventProcessor(EventProcessor):
+    """
+    State per pin disimpan antar tick; tiap tick hanya event baru dari EventFetcher
+    incremental (fetcher.last_new_events) yang diterapkan. Event yang datang tidak urut
+    (ts <= event terakhir pin tsb, dikirim fetcher lewat baca ulang lookback) disisipkan ke
+    riwayat pin itu lalu hanya pin itu yang dihitung ulang. Jendela di-reset (ganti hari / reload) → state dibangun ulang dari
+    fetcher.window. Visitor (vis_transaction hari ini) tetap diproses penuh tiap tick.
+    """
+
+    def __init__(self, in_devices: set[str], out_devices: set[str]):
+        super().__init__(in_devices, out_devices)
+        # pin → {"attrs", "newest" (event_time, id), "events" [(ts, type)], "state", "result"}
+        self.pins: Dict[str, dict] = {}
+        self.generation = None  # fetcher.generation terakhir yang sudah diterapkan
+        self.refolds = 0
+
+    def _apply_event(self, e: EventRecord, unknown_devices: set, changed: set):
+        parsed = self._parse_event(e, unknown_devices)
+        if parsed is None:
+            return
+        pin, ev_type, ts = parsed
+
+        entry = self.pins.get(pin)
+        if entry is None:
+            entry = self.pins[pin] = {"attrs": None, "newest": None, "events": [], "state": PersonState(), "result": None}
+
+        # Atribut (dept, nama) diambil dari event valid terbaru, sama seperti proses penuh
+        newest = (e.event_time, e.id)
+        if entry["newest"] is None or newest >= entry["newest"]:
+            entry["newest"] = newest
+            entry["attrs"] = self._person_attrs(e)
+
+        events = entry["events"]
+        if not events or ts > events[-1][0]:
+            events.append((ts, ev_type))
+            entry["state"].apply(ev_type, ts)
+        else:
+            # Terlambat / ts kembar: proses penuh mengurutkan stabil dari input DESC,
+            # jadi event yang lebih baru diletakkan sebelum event dengan ts sama
+            events.insert(bisect.bisect_left(events, (ts,)), (ts, ev_type))
+            state = PersonState()
+            for ev_ts, ev_kind in events:
+                state.apply(ev_kind, ev_ts)
+            entry["state"] = state
+            self.refolds += 1
+
+        changed.add(pin)
+
+    def needs_rebuild(self, fetcher) -> bool:
+        return (
+            fetcher.window_reset
+            or self.generation is None
+            or fetcher.generation != self.generation + 1  # ada tick yang tidak diterapkan
+        )
+
+    async def process_incremental(
+        self,
+        fetcher,
+        visitor_events: List[dict],
+        window: Optional[list] = None,
+        new_events: Optional[list] = None,
+    ) -> Tuple[Dict[str, dict], set]:
+        """
+        (per_person seperti process_events, pin yang berubah di tick ini).
+        window / new_events: bagian fetcher.window / fetcher.last_new_events milik zona ini
+        (ZoneRouter di MultiZoneTracker); default seluruhnya.
+        """
+        unknown_devices = set()
+        changed = set()
+
+        rebuild = self.needs_rebuild(fetcher)
+        if rebuild:
+            self.pins = {}
+            new_events = fetcher.window if window is None else window
+        elif new_events is None:
+            new_events = fetcher.last_new_events
+        for e in map(as_record, new_events):
+            self._apply_event(e, unknown_devices, changed)
+        self.generation = fetcher.generation
+
+        for pin in changed:
+            entry = self.pins[pin]
+            entry["result"] = self._person_result(entry["attrs"], entry["state"])
+
+        # Urutan awal = kemunculan pertama di input DESC (event terbaru per pin), lalu visitor
+        employees = sorted(
+            (item for item in self.pins.items() if item[1]["result"] is not None),
+            key=lambda item: item[1]["newest"],
+            reverse=True,
+        )
+        result = {pin: entry["result"] for pin, entry in employees}
+
+        visitors = self._process(visitor_events, unknown_devices)
+        result.update(visitors)
+        changed.update(visitors)
 
-        sorted_result = dict(
-            sorted(result.items(), key=lambda item: self.timestamp_from_str(item[1].get("last_time", "")) or 0, reverse=True)
+        log.info(
+            f"[EventProcessor] Incremental: {len(new_events)} events applied "
+            f"({'rebuild' if rebuild else 'delta'}), {len(changed)} pins changed, {self.refolds} refolds total"
         )
-        return sorted_result
+        self._log_result(result, unknown_devices)
+        return self._sort_result(result), changed
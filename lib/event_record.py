@@ -0,0 +1,108 @@
+from sys import intern
+from typing import Any, Optional
+
+FIELDS = (
+    "id", "pin", "name", "dept_name", "dev_alias", "event_point_name",
+    "event_time", "ts", "label", "company", "visit_reason", "host",
+)
+_FIELD_SET = frozenset(FIELDS)
+
+
+def _intern(value):
+    # pin, nama, departemen dan device berulang puluhan ribu kali per tick → satu objek string
+    return intern(value) if type(value) is str else value
+
+
+class EventRecord:
+    """
+    Satu event absensi (acc_transaction) atau visitor (vis_visitor_lastaddr) dengan __slots__.
+    Jauh lebih kecil dari dict per baris; get()/[] tetap tersedia untuk kode lama.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        id=None,
+        pin: str = "",
+        name: str = "",
+        dept_name: Optional[str] = None,
+        dev_alias: Optional[str] = None,
+        event_point_name: Optional[str] = None,
+        event_time=None,
+        ts: Optional[int] = None,
+        label: Optional[str] = None,
+        company: Optional[str] = None,
+        visit_reason: Optional[str] = None,
+        host: Optional[dict] = None,
+    ):
+        self.id = id
+        self.pin = _intern(pin)
+        self.name = _intern(name)
+        self.dept_name = _intern(dept_name)
+        self.dev_alias = _intern(dev_alias)
+        self.event_point_name = _intern(event_point_name)
+        self.event_time = event_time
+        self.ts = ts
+        self.label = label
+        self.company = company
+        self.visit_reason = visit_reason
+        self.host = host
+
+    @classmethod
+    def from_row(cls, row) -> "EventRecord":
+        """Record asyncpg acc_transaction (EVENT_COLUMNS) → EventRecord, ts dihitung sekali di sini."""
+        # Jalur panas (puluhan ribu baris per tick): isi slot langsung tanpa __init__
+        event = cls.__new__(cls)
+        event_time = row["event_time"]
+        event.id = row["id"]
+        event.pin = _intern(row["pin"])
+        event.name = _intern(row["name"])
+        event.dept_name = _intern(row["dept_name"])
+        event.dev_alias = _intern(row["dev_alias"])
+        event.event_point_name = _intern(row["event_point_name"])
+        event.event_time = event_time
+        event.ts = int(event_time.timestamp()) if event_time else None
+        event.label = event.company = event.visit_reason = event.host = None
+        return event
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "EventRecord":
+        """Dict event format lama (termasuk kunci alias department/device/time)."""
+        return cls(
+            id=data.get("id"),
+            pin=data.get("pin", ""),
+            name=data.get("name", ""),
+            dept_name=data.get("dept_name") or data.get("department"),
+            dev_alias=data.get("dev_alias") or data.get("device"),
+            event_point_name=data.get("event_point_name"),
+            event_time=data.get("event_time") or data.get("time"),
+            ts=data.get("ts"),
+            label=data.get("label"),
+            company=data.get("company"),
+            visit_reason=data.get("visit_reason"),
+            host=data.get("host"),
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _FIELD_SET else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def as_dict(self) -> dict:
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def __repr__(self) -> str:
+        return f"EventRecord(pin={self.pin!r}, dev_alias={self.dev_alias!r}, event_time={self.event_time!r})"
+
+
+def as_record(event) -> EventRecord:
+    return event if type(event) is EventRecord else EventRecord.from_dict(event)
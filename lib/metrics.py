@@ -0,0 +1,239 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from lib.detail_cache import DetailCache, attribute_cache, person_cache
+
+# Bucket detik untuk tahap tick dan query (tick normal < 1 s, batas wait_for 120 s)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # ditulis dari thread worker, dibaca thread waitress
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=STAGE_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [hitungan per bucket (non-kumulatif) + slot +Inf, sum]
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Kumpulan metric proses (worker dan Flask satu proses) dalam format teks Prometheus."""
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets=STAGE_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def collector(self, fn: Callable[[], List[str]]):
+        """fn() → baris teks, dipanggil saat render (nilai yang sudah dihitung di tempat lain)."""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for fn in self.collectors:
+            lines.extend(fn())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "tracker_stage_seconds", "Durasi tiap tahap tick tracker",
+    ("zone", "stage"),
+)
+TICK_SECONDS = REGISTRY.histogram(
+    "tracker_tick_seconds", "Durasi satu tick penuh (fetch sampai simpan)",
+    ("zone",),
+)
+TICKS = REGISTRY.counter(
+    "tracker_ticks_total", "Jumlah tick per hasil (saved, unchanged, offline, timeout, error)",
+    ("zone", "result"),
+)
+TICK_OVERRUNS = REGISTRY.counter(
+    "tracker_tick_overruns_total", "Tick yang lebih lama dari INTERVAL_*_SEC zona",
+    ("zone",),
+)
+TICK_TIMEOUTS = REGISTRY.counter(
+    "tracker_tick_timeouts_total", "Tick yang dibatalkan wait_for (120 s)",
+    ("zone",),
+)
+TICK_INTERVAL = REGISTRY.gauge(
+    "tracker_tick_interval_seconds", "Interval tick yang dikonfigurasi",
+    ("zone",),
+)
+ROWS = REGISTRY.counter(
+    "tracker_rows_total", "Baris yang diproses (events, visitors, persons)",
+    ("zone", "source"),
+)
+LAST_ROWS = REGISTRY.gauge(
+    "tracker_last_tick_rows", "Jumlah baris pada tick terakhir",
+    ("zone", "source"),
+)
+PAYLOAD_BYTES = REGISTRY.gauge(
+    "tracker_last_payload_bytes", "Ukuran JSON yang ditulis ke zone_data pada tick terakhir",
+    ("zone", "kind"),
+)
+DB_QUERIES = REGISTRY.counter("tracker_db_queries_total", "Round trip query asyncpg worker")
+DB_QUERY_ERRORS = REGISTRY.counter("tracker_db_query_errors_total", "Query asyncpg worker yang gagal")
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "tracker_db_query_seconds", "Durasi round trip query asyncpg worker", buckets=QUERY_BUCKETS,
+)
+
+
+def stage(zone: str, name: str):
+    """with stage("hijau", "fetch"): ... → tracker_stage_seconds{zone, stage}."""
+    return STAGE_SECONDS.time(zone=zone, stage=name)
+
+
+def count_rows(zone: str, source: str, rows: int):
+    ROWS.inc(rows, zone=zone, source=source)
+    LAST_ROWS.set(rows, zone=zone, source=source)
+
+
+def _on_query(record):
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe(record.elapsed)
+    if record.exception is not None:
+        DB_QUERY_ERRORS.inc()
+
+
+def track_queries(conn):
+    """Hitung semua query di koneksi asyncpg ini (logger hilang saat koneksi ditutup)."""
+    conn.add_query_logger(_on_query)
+    return conn
+
+
+async def init_connection(conn):
+    # init= untuk asyncpg.create_pool: dipanggil sekali per koneksi fisik baru
+    track_queries(conn)
+
+
+# label cache: person = detail person per pin, attribute = mapping pers_attribute
+_CACHES: Dict[str, DetailCache] = {"person": person_cache, "attribute": attribute_cache}
+
+
+@REGISTRY.collector
+def _cache_metrics() -> List[str]:
+    stats = {name: cache.stats() for name, cache in _CACHES.items()}
+    lines = []
+    for field, kind, help_text in (
+        ("hits", "counter", "Lookup yang terjawab dari cache (cache=person: detail per pin, cache=attribute: mapping pers_attribute)"),
+        ("misses", "counter", "Lookup yang tidak ada / kedaluwarsa di cache dan harus di-query ke DB"),
+        ("evictions", "counter", "Entri dibuang karena cache LRU penuh"),
+        ("expirations", "counter", "Entri dibuang karena melewati TTL"),
+        ("invalidations", "counter", "Entri dihapus karena data sumbernya berubah"),
+        ("size", "gauge", "Jumlah entri di cache saat ini"),
+        ("hit_rate", "gauge", "Rasio hit / (hit + miss) sejak proses start"),
+    ):
+        name = f"detail_cache_{field}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for cache, values in stats.items():
+            lines.append(f'{name}{{cache="{cache}"}} {_number(values[field])}')
+    return lines
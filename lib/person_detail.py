@@ -1,23 +1,126 @@
 import os
 import logging
-from typing import Optional
+from typing import Iterable, Optional
+
+from lib.detail_cache import DetailCache, NOT_FOUND, attribute_cache, person_cache
 
 log = logging.getLogger("api_tracker")
 
 
 class PersonDetailFetcher:
-    def __init__(self):
-        self.cache = {}
+    """
+    Detail person (nama, gender, plat, atribut custom) per pin. Cache default adalah
+    person_cache milik proses, jadi tetap hidup walau SummaryBuilder dibuat ulang tiap tick.
+    """
+
+    def __init__(self, cache: Optional[DetailCache] = None, attr_cache: Optional[DetailCache] = None):
+        self.cache = cache if cache is not None else person_cache
+        self.attr_cache = attr_cache if attr_cache is not None else attribute_cache
+        # Pin yang tidak ada di pers_person disimpan sebagai NOT_FOUND dengan TTL lebih pendek
+        self.not_found_ttl = float(os.getenv("PERSON_CACHE_NOT_FOUND_TTL_SEC", "60"))
         self.custom_keys = [
             k.strip().lower() for k in os.getenv("CUSTOM_ATTRIBUT", "").split(",") if k.strip()
         ]
 
+    @staticmethod
+    def _gender(value) -> str:
+        return {"M": "Male", "F": "Female"}.get(value, "")
+
+    async def _attr_mapping(self, conn) -> dict:
+        """Mapping atribut custom → filed_index dari pers_attribute (di-cache per proses)."""
+        if not self.custom_keys:
+            return {}
+        key = tuple(self.custom_keys)
+        mapping = self.attr_cache.get(key)
+        if mapping is None:
+            attr_rows = await conn.fetch(
+                "SELECT attr_name, filed_index FROM pers_attribute WHERE LOWER(attr_name) = ANY($1)",
+                self.custom_keys,
+            )
+            mapping = {r["attr_name"].lower(): r["filed_index"] for r in attr_rows}
+            self.attr_cache.set(key, mapping)
+        return mapping
+
+    async def prefetch(self, conn, pins: Iterable[str]) -> int:
+        """
+        Muat detail semua pin yang belum ada di cache dengan satu set query = ANY($1)
+        (pers_person, park_car_number, pers_attribute, pers_attribute_ext).
+        Mengembalikan jumlah query yang dijalankan.
+        """
+        missing = [p for p in dict.fromkeys(pins) if p not in self.cache]
+        if not missing:
+            return 0
+
+        queries = 0
+        try:
+            persons = await conn.fetch("""
+                SELECT id, pin, name, gender
+                FROM pers_person
+                WHERE pin = ANY($1)
+            """, missing)
+            queries += 1
+
+            by_pin = {r["pin"]: r for r in persons}
+            person_ids = [r["id"] for r in persons]
+
+            plates = {}
+            ext_rows = {}
+            attr_mapping = {}
+            if person_ids:
+                cars = await conn.fetch(
+                    "SELECT person_id, car_number FROM park_car_number WHERE person_id = ANY($1)", person_ids
+                )
+                queries += 1
+                for car in cars:
+                    if car["car_number"] and car["person_id"] not in plates:
+                        plates[car["person_id"]] = car["car_number"]
+
+                if self.custom_keys:
+                    queries += tuple(self.custom_keys) not in self.attr_cache
+                    attr_mapping = await self._attr_mapping(conn)
+
+                if attr_mapping:
+                    rows = await conn.fetch(
+                        "SELECT * FROM pers_attribute_ext WHERE person_id = ANY($1)", person_ids
+                    )
+                    queries += 1
+                    for row in rows:
+                        ext_rows.setdefault(row["person_id"], row)
+
+            for pin in missing:
+                person = by_pin.get(pin)
+                if not person:
+                    self.cache.set(pin, NOT_FOUND, ttl=self.not_found_ttl)
+                    continue
+
+                detail = {
+                    "name": person["name"],
+                    "id": person["pin"],
+                    "time": "",
+                    "gender": self._gender(person["gender"]),
+                    "plat": plates.get(person["id"], ""),
+                }
+                attr_ext = ext_rows.get(person["id"])
+                for key, idx in attr_mapping.items():
+                    if attr_ext and idx < len(attr_ext):
+                        detail[key] = attr_ext[idx]
+                self.cache.set(pin, detail)
+
+            log.info(
+                f"[PersonDetail] Prefetched {len(missing)} pins "
+                f"({len(missing) - len(by_pin)} not found) in {queries} queries"
+            )
+        except Exception as e:
+            log.error(f"[DB] Error prefetching person details: {e}")
+        return queries
+
     async def get(self, conn, pin: str, last_time: str, name: str) -> Optional[dict]:
-        if pin in self.cache:
-            cached = self.cache[pin].copy()
-            cached["time"] = last_time
-            cached["name"] = name or cached["name"]
-            return cached
+        cached = self.cache.get(pin)
+        if cached is NOT_FOUND:
+            return {}
+        if cached is not None:
+            # Entri cache tidak pernah diubah; hasil per tick dibuat sekali dengan time/name terbaru
+            return {**cached, "time": last_time, "name": name or cached["name"]}
 
         try:
             # Ambil data dari pers_person
@@ -27,6 +130,7 @@ class PersonDetailFetcher:
                 WHERE pin = $1
             """, pin)
             if not person:
+                self.cache.set(pin, NOT_FOUND, ttl=self.not_found_ttl)
                 return {}
 
             person_id = person["id"]
@@ -43,18 +147,12 @@ class PersonDetailFetcher:
                 "name": name or person["name"],
                 "id": person["pin"],
                 "time": last_time,
-                "gender": {"M": "Male", "F": "Female"}.get(person["gender"], ""),
+                "gender": self._gender(person["gender"]),
                 "plat": plat,
             }
 
             # Mapping NIPEG/JABATAN/KODE dari env
-            attr_mapping = {}
-            if self.custom_keys:
-                attr_rows = await conn.fetch(
-                    "SELECT attr_name, filed_index FROM pers_attribute WHERE LOWER(attr_name) = ANY($1)",
-                    self.custom_keys,
-                )
-                attr_mapping = {r["attr_name"].lower(): r["filed_index"] for r in attr_rows}
+            attr_mapping = await self._attr_mapping(conn)
 
             # Ambil dari pers_attribute_ext
             if attr_mapping:
@@ -65,7 +163,7 @@ class PersonDetailFetcher:
                     if attr_ext and idx < len(attr_ext):
                         detail[key] = attr_ext[idx]
 
-            self.cache[pin] = detail.copy()
+            self.cache.set(pin, dict(detail, name=person["name"], time=""))
             return detail
 
         except Exception as e:
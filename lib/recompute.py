@@ -0,0 +1,213 @@
+"""
+Hitung ulang ringkasan historis dari acc_transaction di luar worker live.
+
+Event dimuat sekali ke EventBatch (kolom numpy), lalu dibagi per hari atau per hash pin
+dan diproses paralel di ProcessPoolExecutor. Tiap shard hanya menerima array ringkas,
+bukan list dict. Hasil digabung menjadi struktur yang sama dengan SummaryBuilder.
+
+Contoh:
+    python -m lib.recompute --zone hijau --start 2026-09-01 --end 2026-09-30 --workers 8
+    python -m lib.recompute --zone merah --start 2026-09-01 --end 2026-09-02 --by pin --output merah.json
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import argparse
+import datetime
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from lib.batch_processor import BatchBuilder, EventBatch, fold_batch
+from lib.event_fetcher import EventFetcher
+from lib.event_processor import EventProcessor
+from lib.summary_builder import SummaryBuilder
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+log = logging.getLogger("api_tracker")
+
+
+async def load_batch(
+    dsn: str,
+    processor: EventProcessor,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    per_page: int = 5000,
+) -> EventBatch:
+    """acc_transaction antara start dan end, urut terbaru dulu seperti worker live, per halaman keyset."""
+    fetcher = EventFetcher(dsn, paging="keyset")
+    builder = BatchBuilder(processor, set())
+    after = None
+    try:
+        while True:
+            page = await fetcher.fetch_range_after(start, end, after, per_page, order="desc")
+            if page is None:
+                raise ConnectionError("Gagal mengambil acc_transaction")
+            builder.extend(page)  # dict halaman ini langsung dibuang setelah masuk kolom
+            if len(page) < per_page:
+                break
+            after = fetcher._event_key(page[-1])
+    finally:
+        await fetcher.close()
+
+    if builder.unknown_devices:
+        log.warning(f"[Recompute] Unknown devices: {', '.join(sorted(builder.unknown_devices))}")
+    return builder.build()
+
+
+def _fold_shard(in_devices: set, out_devices: set, batch: EventBatch) -> Dict[str, dict]:
+    # Dijalankan di proses worker: hanya butuh daftar device + array shard
+    return fold_batch(EventProcessor(in_devices, out_devices), batch)
+
+
+def _day_start(day: datetime.date) -> int:
+    return int(datetime.datetime.combine(day, datetime.time.min).timestamp())
+
+
+def shard_by_day(batch: EventBatch, days: List[datetime.date]) -> Iterator[Tuple[datetime.date, EventBatch]]:
+    """Jendela 2 hari (kemarin + hari ini) per tanggal, sama dengan yang dilihat dashboard di akhir hari."""
+    one_day = datetime.timedelta(days=1)
+    for day in days:
+        start = _day_start(day - one_day)
+        end = _day_start(day + one_day)
+        yield day, batch.subset((batch.ts >= start) & (batch.ts < end))
+
+
+def shard_by_pin(batch: EventBatch, shards: int) -> List[EventBatch]:
+    """Semua event satu pin selalu masuk shard yang sama (crc32 pin, stabil antar proses)."""
+    pin_shard = np.array([zlib.crc32(pin.encode("utf-8")) % shards for pin in batch.pins], dtype=np.int32)
+    event_shard = pin_shard[batch.pin_codes]
+    return [batch.subset(event_shard == i) for i in range(shards)]
+
+
+def _executor(workers: Optional[int]):
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+
+def recompute_days(
+    batch: EventBatch,
+    in_devices: set,
+    out_devices: set,
+    days: List[datetime.date],
+    workers: Optional[int] = None,
+) -> Dict[datetime.date, Dict[str, dict]]:
+    """{tanggal: per_person} seperti EventProcessor.process_events untuk tiap hari."""
+    with _executor(workers) as pool:
+        futures = {
+            day: pool.submit(_fold_shard, in_devices, out_devices, shard)
+            for day, shard in shard_by_day(batch, days)
+        }
+        return {day: EventProcessor._sort_result(f.result()) for day, f in futures.items()}
+
+
+def recompute_pins(
+    batch: EventBatch,
+    in_devices: set,
+    out_devices: set,
+    shards: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, dict]:
+    """per_person untuk seluruh batch, dibagi per hash pin lalu digabung kembali."""
+    shards = shards or workers or os.cpu_count()
+    with _executor(workers) as pool:
+        results = list(pool.map(
+            _fold_shard,
+            [in_devices] * shards,
+            [out_devices] * shards,
+            shard_by_pin(batch, shards),
+        ))
+
+    # Urutan awal = kemunculan pertama pin di seluruh batch, lalu urut last_ts seperti path dict
+    first_pins, first_idx = np.unique(batch.pin_codes, return_index=True)
+    rank = {batch.pins[code]: idx for code, idx in zip(first_pins.tolist(), first_idx.tolist())}
+    merged = {}
+    for result in results:
+        merged.update(result)
+    return EventProcessor._sort_result(dict(sorted(merged.items(), key=lambda item: rank[item[0]])))
+
+
+def summarize(per_person: Dict[str, dict]) -> dict:
+    """Ringkasan SummaryBuilder tanpa query detail ke DB (pakai SummaryBuilder.build untuk detail lengkap)."""
+    details = {}
+    for pin, data in per_person.items():
+        if data.get("current", 0) > 0:
+            detail = SummaryBuilder.basic_detail(pin, data)
+            if data.get("possibly_stuck"):
+                detail["possibly_stuck"] = True
+            details[pin] = detail
+    return SummaryBuilder.summarize(per_person, details)
+
+
+def zone_devices(zone: str) -> Tuple[set, set]:
+    in_devices = {d.strip().lower() for d in os.getenv(f"IN_DEVICES_{zone.upper()}", "").split(",") if d.strip()}
+    out_devices = {d.strip().lower() for d in os.getenv(f"OUT_DEVICES_{zone.upper()}", "").split(",") if d.strip()}
+    return in_devices, out_devices
+
+
+async def _with_details(per_person: Dict[str, dict]) -> dict:
+    return await SummaryBuilder(os.getenv("DATABASE_URL")).build(per_person)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Hitung ulang ringkasan zona dari acc_transaction")
+    parser.add_argument("--zone", required=True, help="nama zona (IN_DEVICES_<ZONA>/OUT_DEVICES_<ZONA>)")
+    parser.add_argument("--start", required=True, type=datetime.date.fromisoformat, help="tanggal awal (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, type=datetime.date.fromisoformat, help="tanggal akhir (YYYY-MM-DD)")
+    parser.add_argument("--by", choices=("day", "pin"), default="day",
+                        help="day = ringkasan per tanggal, pin = satu ringkasan seluruh rentang dibagi per hash pin")
+    parser.add_argument("--workers", type=int, default=None, help="jumlah proses (default: jumlah CPU)")
+    parser.add_argument("--details", action="store_true", help="ambil detail person dari DB (nama, plat, atribut)")
+    parser.add_argument("--output", help="file JSON hasil (default: stdout)")
+    args = parser.parse_args(argv)
+
+    in_devices, out_devices = zone_devices(args.zone)
+    if not in_devices or not out_devices:
+        parser.error(f"IN/OUT devices zona {args.zone} kosong")
+
+    dsn = os.getenv("DATABASE_URL")
+    # Jendela per tanggal butuh event sehari sebelum tanggal awal
+    load_from = args.start - datetime.timedelta(days=1) if args.by == "day" else args.start
+    started = time.perf_counter()
+    batch = asyncio.run(load_batch(
+        dsn,
+        EventProcessor(in_devices, out_devices),
+        datetime.datetime.combine(load_from, datetime.time.min),
+        datetime.datetime.combine(args.end + datetime.timedelta(days=1), datetime.time.min),
+    ))
+    loaded = time.perf_counter()
+    log.info(f"[Recompute] Loaded {len(batch)} events, {len(batch.pins)} pins in {loaded - started:.2f}s")
+
+    if args.by == "day":
+        days = [args.start + datetime.timedelta(days=i) for i in range((args.end - args.start).days + 1)]
+        per_day = recompute_days(batch, in_devices, out_devices, days, args.workers)
+        build = (lambda p: asyncio.run(_with_details(p))) if args.details else summarize
+        output = {"zone": args.zone, "by": "day", "days": {day.isoformat(): build(p) for day, p in per_day.items()}}
+    else:
+        per_person = recompute_pins(batch, in_devices, out_devices, workers=args.workers)
+        summary = asyncio.run(_with_details(per_person)) if args.details else summarize(per_person)
+        output = {"zone": args.zone, "by": "pin", "start": args.start.isoformat(), "end": args.end.isoformat(),
+                  "summary": summary}
+
+    log.info(f"[Recompute] Processed in {time.perf_counter() - loaded:.2f}s")
+
+    payload = json.dumps(output, default=str)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    else:
+        sys.stdout.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # build PyInstaller di Windows
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(levelname)s] %(message)s")
+    main()
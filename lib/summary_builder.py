@@ -1,5 +1,6 @@
 import logging
-import asyncpg
+from lib.db_pool import connection
+from lib.detail_cache import person_cache
 from lib.person_detail import PersonDetailFetcher
 
 log = logging.getLogger("api_tracker")
@@ -14,17 +15,16 @@ EMPTY_SUMMARY = {
 
 
 class SummaryBuilder:
-    def __init__(self, db_dsn: str):
+    def __init__(self, db_dsn: str, pool=None):
         self.db_dsn = db_dsn
+        self.pool = pool
         self.person_fetcher = PersonDetailFetcher()
 
-    async def _build_person_detail(self, conn, pin: str, data: dict) -> dict:
-        """
-        Ambil detail person dari DB jika bukan visitor,
-        langsung gunakan data visitor jika label visitor.
-        """
+    @staticmethod
+    def basic_detail(pin: str, data: dict) -> dict:
+        """Detail tanpa query DB: data visitor apa adanya, karyawan hanya id/nama/waktu."""
         if data.get("label") == "visitor":
-            detail = {
+            return {
                 "pin": pin,
                 "name": data["name"],
                 "time": data["last_time"],
@@ -33,6 +33,15 @@ class SummaryBuilder:
                 "visit_reason": data.get("visit_reason"),
                 "host": data.get("host"),
             }
+        return {"name": data["name"], "id": pin, "time": data["last_time"]}
+
+    async def _build_person_detail(self, conn, pin: str, data: dict) -> dict:
+        """
+        Ambil detail person dari DB jika bukan visitor,
+        langsung gunakan data visitor jika label visitor.
+        """
+        if data.get("label") == "visitor":
+            detail = self.basic_detail(pin, data)
         else:
             detail = await self.person_fetcher.get(conn, pin, data["last_time"], data["name"]) or {}
 
@@ -42,7 +51,12 @@ class SummaryBuilder:
 
         return detail
 
-    async def build(self, per_person: dict) -> dict:
+    @staticmethod
+    def summarize(per_person: dict, details: dict) -> dict:
+        """
+        Ringkasan total dan per departemen dari hasil EventProcessor (tanpa I/O).
+        details = {pin: detail} untuk person yang masih di dalam (current > 0).
+        """
         summary = {
             "offline": False,
             "totalin": 0,
@@ -53,41 +67,57 @@ class SummaryBuilder:
         }
 
         departments = {}
+        for pin, data in per_person.items():
+            dept = data.get("dept") or "UNKNOWN"
+            dept_data = departments.setdefault(dept, {
+                "dept": dept,
+                "in": 0,
+                "out": 0,
+                "cur": 0,
+                "person": {"data": []}
+            })
+
+            # Pakai logical_in, logical_out, current hasil dari process_events
+            in_count = data.get("logical_in", 0)
+            out_count = data.get("logical_out", 0)
+            current_count = data.get("current", 0)
+
+            summary["totalin"] += in_count
+            summary["totalout"] += out_count
+            dept_data["in"] += in_count
+            dept_data["out"] += out_count
+            dept_data["cur"] += current_count
+            summary["totalcur"] += current_count
+
+            if current_count > 0:  # status inside setara current > 0
+                detail = details[pin]
+
+                if data.get("possibly_stuck"):
+                    summary["warning"].append(detail)
+
+                dept_data["person"]["data"].append(detail)
+
+        summary["data"] = list(departments.values())
+        return summary
 
+    async def build(self, per_person: dict) -> dict:
         try:
-            async with asyncpg.create_pool(dsn=self.db_dsn) as pool:
-                async with pool.acquire() as conn:
-                    for pin, data in per_person.items():
-                        dept = data.get("dept") or "UNKNOWN"
-                        dept_data = departments.setdefault(dept, {
-                            "dept": dept,
-                            "in": 0,
-                            "out": 0,
-                            "cur": 0,
-                            "person": {"data": []}
-                        })
-
-                        # Pakai logical_in, logical_out, current hasil dari process_events
-                        in_count = data.get("logical_in", 0)
-                        out_count = data.get("logical_out", 0)
-                        current_count = data.get("current", 0)
-
-                        summary["totalin"] += in_count
-                        summary["totalout"] += out_count
-                        dept_data["in"] += in_count
-                        dept_data["out"] += out_count
-                        dept_data["cur"] += current_count
-                        summary["totalcur"] += current_count
-
-                        if current_count > 0:  # status inside setara current > 0
-                            detail = await self._build_person_detail(conn, pin, data)
-
-                            if data.get("possibly_stuck"):
-                                summary["warning"].append(detail)
-
-                            dept_data["person"]["data"].append(detail)
-
-            summary["data"] = list(departments.values())
+            details = {}
+            async with connection(self.pool, self.db_dsn) as conn:
+                # Muat detail semua person di dalam sekaligus, bukan satu per satu.
+                # Semua pin di dalam dikirim (bukan hanya yang berubah): prefetch sendiri melewati
+                # pin yang masih di cache, jadi entri yang kedaluwarsa (TTL) ikut dimuat massal
+                await self.person_fetcher.prefetch(conn, [
+                    pin for pin, data in per_person.items()
+                    if data.get("current", 0) > 0 and data.get("label") != "visitor"
+                ])
+
+                for pin, data in per_person.items():
+                    if data.get("current", 0) > 0:
+                        details[pin] = await self._build_person_detail(conn, pin, data)
+
+            summary = self.summarize(per_person, details)
+            log.info(f"[PersonDetail] Cache {person_cache.stats()}")
             return summary
 
         except Exception as e:
@@ -0,0 +1,154 @@
+import copy
+import json
+
+TOTAL_KEYS = ("offline", "totalin", "totalout", "totalcur")
+
+
+def person_key(detail: dict) -> str:
+    """Identitas person di ringkasan: id (karyawan) atau pin (visitor)."""
+    key = detail.get("id") or detail.get("pin")
+    if key:
+        return str(key)
+    # Detail kosong (pin tidak ada di pers_person) → pakai isinya sebagai kunci
+    return json.dumps(detail, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _persons(dept_data: dict) -> list:
+    return dept_data.get("person", {}).get("data", [])
+
+
+def _keyed(people: list) -> dict:
+    """{kunci: detail} dengan urutan asli; kunci kembar diberi akhiran #n."""
+    keyed = {}
+    for p in people:
+        key = base = person_key(p)
+        n = 1
+        while key in keyed:
+            key = f"{base}#{n}"
+            n += 1
+        keyed[key] = p
+    return keyed
+
+
+def diff_summary(prev: dict, curr: dict) -> dict:
+    """
+    Diff struktural dua ringkasan SummaryBuilder: total, counter per departemen,
+    person yang masuk/berubah (upsert) dan yang keluar (left) per departemen.
+    apply_diff(prev, diff_summary(prev, curr)) == curr.
+    """
+    diff = {"totals": {k: curr.get(k) for k in TOTAL_KEYS if k in curr}}
+
+    prev_depts = {d["dept"]: d for d in prev.get("data", [])}
+    curr_depts = {d["dept"]: d for d in curr.get("data", [])}
+
+    if list(prev_depts) != list(curr_depts):
+        diff["order"] = list(curr_depts)
+
+    removed = [dept for dept in prev_depts if dept not in curr_depts]
+    if removed:
+        diff["removed_depts"] = removed
+
+    counters = {}
+    persons = {}
+    for dept, data in curr_depts.items():
+        old = prev_depts.get(dept)
+        counts = {"in": data["in"], "out": data["out"], "cur": data["cur"]}
+        if old is None or any(old[k] != v for k, v in counts.items()):
+            counters[dept] = counts
+
+        old_people = _keyed(_persons(old)) if old else {}
+        new_people = _keyed(_persons(data))
+        upsert = [[key, p] for key, p in new_people.items() if old_people.get(key) != p]
+        left = [key for key in old_people if key not in new_people]
+        order = list(new_people)
+
+        if upsert or left or order != list(old_people) or old is None:
+            persons[dept] = {"upsert": upsert, "left": left, "order": order}
+
+    if counters:
+        diff["depts"] = counters
+    if persons:
+        diff["persons"] = persons
+    if prev.get("warning") != curr.get("warning"):
+        diff["warning"] = curr.get("warning", [])
+    return diff
+
+
+def is_empty(diff: dict) -> bool:
+    return set(diff) <= {"totals"}
+
+
+def apply_diff(summary: dict, diff: dict) -> dict:
+    """Terapkan diff ke ringkasan, hasilkan ringkasan baru (input tidak diubah)."""
+    result = {k: v for k, v in summary.items() if k != "data"}
+    result.update(diff.get("totals", {}))
+
+    depts = {d["dept"]: copy.deepcopy(d) for d in summary.get("data", [])}
+    for dept in diff.get("removed_depts", []):
+        depts.pop(dept, None)
+
+    for dept, counts in diff.get("depts", {}).items():
+        dept_data = depts.setdefault(dept, {"dept": dept, "in": 0, "out": 0, "cur": 0, "person": {"data": []}})
+        dept_data.update(counts)
+
+    for dept, change in diff.get("persons", {}).items():
+        dept_data = depts.setdefault(dept, {"dept": dept, "in": 0, "out": 0, "cur": 0, "person": {"data": []}})
+        people = _keyed(_persons(dept_data))
+        for key in change.get("left", []):
+            people.pop(key, None)
+        for key, p in change.get("upsert", []):
+            people[key] = p
+        dept_data["person"] = {"data": [people[key] for key in change["order"] if key in people]}
+
+    order = diff.get("order", list(depts))
+    result["data"] = [depts[dept] for dept in order if dept in depts]
+
+    if "warning" in diff:
+        result["warning"] = diff["warning"]
+    return result
+
+
+def merge_diffs(first: dict, second: dict) -> dict:
+    """Gabungkan dua diff berurutan (first lalu second) menjadi satu diff."""
+    merged = copy.deepcopy(first)
+    merged["totals"] = dict(second.get("totals", {}))
+
+    if "order" in second:
+        merged["order"] = second["order"]
+
+    removed = set(merged.get("removed_depts", [])) | set(second.get("removed_depts", []))
+    # Departemen yang muncul lagi di diff kedua tidak lagi dianggap dihapus
+    removed -= set(second.get("depts", {})) | set(second.get("persons", {}))
+    for dept in second.get("removed_depts", []):
+        merged.get("depts", {}).pop(dept, None)
+        merged.get("persons", {}).pop(dept, None)
+    if removed:
+        merged["removed_depts"] = sorted(removed)
+    else:
+        merged.pop("removed_depts", None)
+
+    if second.get("depts"):
+        merged.setdefault("depts", {}).update(second["depts"])
+
+    for dept, change in second.get("persons", {}).items():
+        base = merged.setdefault("persons", {}).get(dept)
+        if base is None:
+            merged["persons"][dept] = copy.deepcopy(change)
+            continue
+        upsert = dict(base["upsert"])
+        left = set(base["left"])
+        for key in change["left"]:
+            upsert.pop(key, None)
+            left.add(key)
+        for key, p in change["upsert"]:
+            upsert[key] = p
+            left.discard(key)
+        merged["persons"][dept] = {
+            "upsert": [[key, p] for key, p in upsert.items()],
+            "left": sorted(left),
+            "order": change["order"],
+        }
+
+    if "warning" in second:
+        merged["warning"] = second["warning"]
+    return merged
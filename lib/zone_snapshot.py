@@ -0,0 +1,118 @@
+import time
+import hashlib
+import datetime
+import threading
+from collections import deque
+from typing import Optional, Tuple, Union
+
+from lib.summary_diff import merge_diffs
+
+
+class ZoneSnapshot:
+    """Ringkasan satu zona yang sudah di-serialize, siap dikirim apa adanya oleh route API."""
+
+    __slots__ = ("zone", "body", "version", "etag", "updated_at", "source", "loaded_at")
+
+    def __init__(self, zone: str, body: bytes, version: int, updated_at: datetime.datetime, source: str):
+        self.zone = zone
+        self.body = body
+        self.version = version
+        self.etag = hashlib.blake2b(body, digest_size=8).hexdigest()  # hash konten untuk ETag
+        self.updated_at = updated_at
+        self.source = source  # "worker" = dipublish worker di proses ini, "db" = dibaca dari zone_data
+        self.loaded_at = time.monotonic()
+
+
+class ZoneSnapshotStore:
+    """
+    Snapshot ringkasan per zona di memori proses. Worker (thread TrackerWorker di proses
+    yang sama) mempublish setiap ringkasan baru; route dashboard membaca dari sini tanpa query DB.
+    Snapshot hasil baca DB (cold start / worker di proses lain) dianggap basi setelah DB_TTL detik.
+    """
+
+    DB_TTL = 10
+    HISTORY = 30  # jumlah diff terakhir per zona untuk ?since=<version>
+
+    def __init__(self):
+        self._snapshots = {}
+        self._history = {}  # zone → deque[(versi_dasar, versi, diff)]
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._last_version = 0
+
+    def _next_version(self) -> int:
+        # Versi = epoch milidetik, selalu naik walau jam mundur
+        self._last_version = max(self._last_version + 1, int(time.time() * 1000))
+        return self._last_version
+
+    def publish(
+        self,
+        zone: str,
+        body: Union[str, bytes],
+        updated_at: Optional[datetime.datetime] = None,
+        source: str = "worker",
+        diff: Optional[dict] = None,
+    ) -> ZoneSnapshot:
+        """diff = perubahan dari snapshot sebelumnya; None berarti tidak ada rantai diff (mulai ulang)."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        with self._lock:
+            previous = self._snapshots.get(zone)
+            snapshot = ZoneSnapshot(
+                zone=zone,
+                body=body,
+                version=self._next_version(),
+                updated_at=updated_at or datetime.datetime.utcnow(),
+                source=source,
+            )
+            self._snapshots[zone] = snapshot
+
+            history = self._history.setdefault(zone, deque(maxlen=self.HISTORY))
+            if diff is not None and previous is not None:
+                history.append((previous.version, snapshot.version, diff))
+            else:
+                history.clear()
+            self._changed.notify_all()
+        return snapshot
+
+    @property
+    def last_version(self) -> int:
+        return self._last_version
+
+    def wait_for_change(self, since: int, timeout: float) -> bool:
+        """Tunggu sampai ada snapshot dengan versi > since. False jika timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._last_version > since, timeout=timeout)
+
+    def changes_since(self, zone: str, since: int) -> Tuple[Optional[ZoneSnapshot], Optional[dict]]:
+        """
+        (snapshot terkini, diff gabungan sejak versi `since`). diff None berarti client
+        harus mengambil ringkasan penuh (versi tidak dikenal / sudah keluar dari history).
+        """
+        with self._lock:
+            snapshot = self.get(zone)
+            if snapshot is None:
+                return None, None
+            if since == snapshot.version:
+                return snapshot, {}
+
+            entries = list(self._history.get(zone, ()))
+        start = next((i for i, (base, _, _) in enumerate(entries) if base == since), None)
+        if start is None or entries[-1][1] != snapshot.version:
+            return snapshot, None
+
+        merged = entries[start][2]
+        for _, _, diff in entries[start + 1:]:
+            merged = merge_diffs(merged, diff)
+        return snapshot, merged
+
+    def get(self, zone: str) -> Optional[ZoneSnapshot]:
+        snapshot = self._snapshots.get(zone)
+        if snapshot is None:
+            return None
+        if snapshot.source != "worker" and time.monotonic() - snapshot.loaded_at > self.DB_TTL:
+            return None
+        return snapshot
+
+
+snapshots = ZoneSnapshotStore()
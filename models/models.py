@@ -1,7 +1,9 @@
 import os
 import datetime
+import threading
 from contextlib import contextmanager
-from sqlalchemy import Column, String, Text, DateTime, create_engine
+from sqlalchemy import Column, String, Text, DateTime, BigInteger, create_engine
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import declarative_base, sessionmaker
 from dotenv import load_dotenv
 
@@ -17,17 +19,69 @@ class ZoneData(Base):
     data = Column(Text, nullable=False)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
+class ZoneDataDelta(Base):
+    """Diff ringkasan per tick sejak checkpoint penuh terakhir di zone_data."""
+    __tablename__ = 'zone_data_delta'
+    zone = Column(String, primary_key=True)
+    version = Column(BigInteger, primary_key=True)
+    data = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+def upsert_zone_data(session, zone: str, data: str):
+    now = datetime.datetime.utcnow()
+    stmt = insert(ZoneData).values(zone=zone, data=data, updated_at=now)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[ZoneData.zone],
+        set_={"data": stmt.excluded.data, "updated_at": now},
+    ))
+
+# === Engine & session factory dibuat sekali per proses ===
+_engine = None
+_session_factory = None
+_engine_lock = threading.RLock()
+
+def _env_bool(key, default):
+    return os.getenv(key, default).strip().lower() in ("1", "true", "yes")
+
 def get_engine():
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url:
-        raise RuntimeError("DATABASE_URL belum didefinisikan di .env")
-    return create_engine(db_url, echo=False, future=True)
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                db_url = os.getenv("DATABASE_URL")
+                if not db_url:
+                    raise RuntimeError("DATABASE_URL belum didefinisikan di .env")
+                _engine = create_engine(
+                    db_url,
+                    echo=False,
+                    future=True,
+                    pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+                    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+                    pool_pre_ping=_env_bool("DB_POOL_PRE_PING", "1"),
+                    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+                )
+    return _engine
+
+def get_session_factory():
+    global _session_factory
+    if _session_factory is None:
+        with _engine_lock:
+            if _session_factory is None:
+                _session_factory = sessionmaker(bind=get_engine(), autoflush=False, autocommit=False)
+    return _session_factory
+
+def dispose_engine():
+    """Tutup semua koneksi pool (dipanggil saat shutdown)."""
+    global _engine, _session_factory
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _session_factory = None
 
 @contextmanager
 def get_session():
-    engine = get_engine()
-    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-    session = Session()
+    session = get_session_factory()()
     try:
         yield session
         session.commit()
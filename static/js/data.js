@@ -1,50 +1,168 @@
+let pollTimer = null;
+// Ringkasan terakhir + versinya, agar polling zona cukup minta perubahan (?since=)
+let zoneState = null;
+
 $(document).ready(function () {
   setInterval(updateClock, 1000);
-  setInterval(getData, 10000);
   updateClock();
   getData();
+  startStream();
 });
 
+// Polling hanya dipakai jika SSE tidak tersedia / terputus
+function startPolling() {
+  if (!pollTimer) pollTimer = setInterval(getData, 10000);
+}
+
+function stopPolling() {
+  if (pollTimer) {
+    clearInterval(pollTimer);
+    pollTimer = null;
+  }
+}
+
+function startStream() {
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+
+  const zone = document.body.dataset.zone;
+  const streamZone = zone === "all" || zone === "merah" ? zone : "hijau";
+  const source = new EventSource(`/api/stream?zone=${streamZone}`);
+
+  source.addEventListener("summary", function (e) {
+    stopPolling();
+    zoneState = null;
+    renderResponse(zone, JSON.parse(e.data));
+  });
+
+  source.onerror = function () {
+    // Browser reconnect otomatis dengan Last-Event-ID; sementara itu pakai polling
+    startPolling();
+    if (source.readyState === EventSource.CLOSED) {
+      // Server menolak (mis. stream penuh) → coba lagi nanti
+      setTimeout(startStream, 60000);
+    }
+  };
+}
+
 function getData() {
   const zone = document.body.dataset.zone;
+  let endpoint = zone === "all" ? "/api/all" : zone === "merah" ? "/api/merah" : "/api/data";
+  if (zone !== "all" && zoneState) endpoint += `?since=${zoneState.version}`;
 
-  if (zone === "all") {
-    $.get("/api/all", function (response) {
-      if (!response || response.hijau?.offline || response.merah?.offline) {
-        showOfflineAlert();
-        return;
-      }
-
-      $("#offline-alert").hide();
-      renderAllData(response.hijau, response.merah);
-    }).fail(showOfflineAlert);
+  // ifModified: kirim If-None-Match / If-Modified-Since, 304 berarti data belum berubah
+  $.ajax({ url: endpoint, ifModified: true }).done(function (response, status, xhr) {
+    if (status === "notmodified") return;
+    renderResponse(zone, zone === "all" ? response : mergeZoneResponse(response, xhr));
+  }).fail(function () {
+    forgetVersion(endpoint);
+    zoneState = null;
+    showOfflineAlert();
+  });
+}
+
+// Gabungkan respons penuh / diff ke zoneState, kembalikan ringkasan lengkap
+function mergeZoneResponse(response, xhr) {
+  if (response.diff) {
+    zoneState = { version: response.version, summary: applyDiff(zoneState.summary, response.diff) };
+  } else if (response.full) {
+    zoneState = { version: response.version, summary: response.full };
   } else {
-    const endpoint = zone === "merah" ? "/api/merah" : "/api/data";
-    $.get(endpoint, function (response) {
-      if (response.offline) {
-        showOfflineAlert();
-        return;
-      }
-
-      $("#offline-alert").hide();
-      $("#totalin").text(response.totalin);
-      $("#totalout").text(response.totalout);
-      $("#totalcur").text(response.totalcur);
-
-      let html = '';
-      response.data.forEach(dept => {
-        html += `
-          <tr>
-            <td class="text-left"><strong>${dept.dept}</strong></td>
-            <td><strong>${dept.in}</strong></td>
-            <td><strong>${dept.out}</strong></td>
-            <td><strong>${dept.cur}</strong></td>
-          </tr>
-        `;
-      });
-      $("#dept-table").html(html);
-    }).fail(showOfflineAlert);
+    const version = xhr.getResponseHeader("X-Zone-Version");
+    zoneState = version ? { version: version, summary: response } : null;
+    return response;
+  }
+  return zoneState.summary;
+}
+
+// Sama dengan lib/summary_diff.apply_diff
+function applyDiff(summary, diff) {
+  const result = Object.assign({}, summary, diff.totals || {});
+  const depts = {};
+  (summary.data || []).forEach(d => { depts[d.dept] = d; });
+
+  (diff.removed_depts || []).forEach(dept => { delete depts[dept]; });
+
+  Object.entries(diff.depts || {}).forEach(([dept, counts]) => {
+    const base = depts[dept] || { dept: dept, in: 0, out: 0, cur: 0, person: { data: [] } };
+    depts[dept] = Object.assign({}, base, counts);
+  });
+
+  Object.entries(diff.persons || {}).forEach(([dept, change]) => {
+    const base = depts[dept] || { dept: dept, in: 0, out: 0, cur: 0, person: { data: [] } };
+    const people = keyedPersons(base.person.data);
+    change.left.forEach(key => { delete people[key]; });
+    change.upsert.forEach(([key, person]) => { people[key] = person; });
+    depts[dept] = Object.assign({}, base, {
+      person: { data: change.order.filter(key => key in people).map(key => people[key]) }
+    });
+  });
+
+  const order = diff.order || Object.keys(depts);
+  result.data = order.filter(dept => dept in depts).map(dept => depts[dept]);
+  if ("warning" in diff) result.warning = diff.warning;
+  return result;
+}
+
+function keyedPersons(people) {
+  const keyed = {};
+  people.forEach(p => {
+    const base = p.id || p.pin || JSON.stringify(sortKeys(p));
+    let key = base;
+    for (let n = 1; key in keyed; n++) key = `${base}#${n}`;
+    keyed[key] = p;
+  });
+  return keyed;
+}
+
+function sortKeys(obj) {
+  const sorted = {};
+  Object.keys(obj).sort().forEach(k => { sorted[k] = obj[k]; });
+  return sorted;
+}
+
+function renderResponse(zone, response) {
+  if (zone === "all") {
+    if (!response || response.hijau?.offline || response.merah?.offline) {
+      showOfflineAlert();
+      return;
+    }
+
+    $("#offline-alert").hide();
+    renderAllData(response.hijau, response.merah);
+    return;
+  }
+
+  if (response.offline) {
+    showOfflineAlert();
+    return;
   }
+
+  $("#offline-alert").hide();
+  $("#totalin").text(response.totalin);
+  $("#totalout").text(response.totalout);
+  $("#totalcur").text(response.totalcur);
+
+  let html = '';
+  response.data.forEach(dept => {
+    html += `
+      <tr>
+        <td class="text-left"><strong>${dept.dept}</strong></td>
+        <td><strong>${dept.in}</strong></td>
+        <td><strong>${dept.out}</strong></td>
+        <td><strong>${dept.cur}</strong></td>
+      </tr>
+    `;
+  });
+  $("#dept-table").html(html);
+}
+
+// Setelah gagal, request berikutnya harus ambil data penuh (bukan 304)
+function forgetVersion(url) {
+  delete $.lastModified[url];
+  delete $.etag[url];
 }
 
 function renderAllData(hijau, merah) {
@@ -1,4 +1,4 @@
-﻿# tracker_worker.py
+# tracker_worker.py
 
 import asyncio
 import json
@@ -7,6 +7,7 @@ import os
 import platform
 import signal
 import sys
+import time
 from typing import List
 
 from dotenv import load_dotenv
@@ -41,8 +42,15 @@ def setup_logging():
 log = setup_logging()
 
 # ─── Import setelah path fix ────────────────────────
-from models.models import ZoneData, get_session
-from lib.api_tracker import AsyncApiTracker
+from models.models import ZoneDataDelta, get_session, dispose_engine, upsert_zone_data
+from lib.api_tracker import AsyncApiTracker, MultiZoneTracker
+from lib.event_fetcher import EventFetcher
+from lib.event_processor import IncrementalEventProcessor
+from lib.db_pool import DbPool
+from lib.change_listener import ChangeListener
+from lib.metrics import PAYLOAD_BYTES, TICK_INTERVAL, TICK_OVERRUNS, TICK_SECONDS, TICK_TIMEOUTS, TICKS, stage
+from lib.zone_snapshot import snapshots
+from lib.summary_diff import diff_summary, is_empty
 
 # ─── Konfigurasi Zona ───────────────────────────────
 ZONES: List[dict] = [
@@ -50,45 +58,186 @@ ZONES: List[dict] = [
     {"name": "merah", "in_env": "IN_DEVICES_MERAH", "out_env": "OUT_DEVICES_MERAH", "interval_env": "INTERVAL_MERAH_SEC"},
 ]
 
+# Ambil hanya event baru tiap tick (jendela 2 hari disimpan di memori per zona)
+INCREMENTAL_FETCH = os.getenv("EVENT_FETCH_INCREMENTAL", "0").strip().lower() in ("1", "true", "yes")
+
+# Satu fetch per tick untuk semua zona (bukan satu loop + fetch per zona)
+SHARED_FETCH = os.getenv("WORKER_SHARED_FETCH", "0").strip().lower() in ("1", "true", "yes")
+
+# Ringkasan penuh ditulis ulang ke zone_data setiap N delta; di antaranya hanya diff yang disimpan
+CHECKPOINT_DELTAS = int(os.getenv("ZONE_CHECKPOINT_DELTAS", "15"))
+
+# LISTEN/NOTIFY untuk evict cache detail person saat pers_person/atribut/plat berubah
+CHANGE_LISTENER = os.getenv("PERSON_CHANGE_LISTENER", "0").strip().lower() in ("1", "true", "yes")
+
+# Ringkasan terakhir per zona: {"data", "deltas" (sejak checkpoint), "version"}
+_last_summary = {}
+
 # ─── Worker Logic ───────────────────────────────────
-async def fetch_and_store(zone: str, in_devices: list[str], out_devices: list[str]):
+async def fetch_and_store(zone: str, in_devices: list[str], out_devices: list[str], fetcher: EventFetcher = None, pool: DbPool = None, processor: IncrementalEventProcessor = None):
     try:
         log.info("[%s] Fetching...", zone.upper())
-        tracker = AsyncApiTracker(in_devices, out_devices)
+        tracker = AsyncApiTracker(in_devices, out_devices, fetcher=fetcher, pool=pool, processor=processor, zone=zone)
         data = await asyncio.wait_for(tracker.run(), timeout=120)
 
-        if not isinstance(data, dict) or data.get("offline"):
-            log.warning("[%s] Data invalid / offline", zone.upper())
-            return
-
-        with get_session() as session:
-            session.query(ZoneData).filter_by(zone=zone).delete()
-            session.add(ZoneData(zone=zone, data=json.dumps(data, default=str)))
-
-        log.info("[%s] Saved (in:%d out:%d cur:%d)", zone.upper(), data["totalin"], data["totalout"], data["totalcur"])
+        store_zone(zone, data)
     except asyncio.TimeoutError:
+        TICK_TIMEOUTS.inc(zone=zone)
+        TICKS.inc(zone=zone, result="timeout")
         log.warning("[%s] Timeout", zone.upper())
     except Exception:
+        TICKS.inc(zone=zone, result="error")
         log.exception("[%s] Error saat fetch_store", zone.upper())
 
-async def zone_loop(cfg: dict):
-    name = cfg["name"]
+def store_zone(zone: str, data: dict):
+    if not isinstance(data, dict) or data.get("offline"):
+        TICKS.inc(zone=zone, result="offline")
+        log.warning("[%s] Data invalid / offline", zone.upper())
+        return
+
+    last = _last_summary.get(zone)
+    with stage(zone, "diff"):
+        diff = diff_summary(last["data"], data) if last else None
+    if diff is not None and is_empty(diff):
+        TICKS.inc(zone=zone, result="unchanged")
+        log.info("[%s] Unchanged (in:%d out:%d cur:%d)", zone.upper(), data["totalin"], data["totalout"], data["totalcur"])
+        return
+
+    with stage(zone, "serialize"):
+        payload = json.dumps(data, default=str)
+        diff_json = json.dumps(diff, default=str) if diff is not None else ""
+    # Checkpoint penuh saat start, setiap N delta, atau jika diff tidak lebih hemat dari ringkasan penuh
+    checkpoint = diff is None or last["deltas"] >= CHECKPOINT_DELTAS or len(diff_json) * 2 > len(payload)
+    version = max((last or {}).get("version", 0) + 1, int(time.time() * 1000))
+
+    try:
+        with stage(zone, "db_write"), get_session() as session:
+            if checkpoint:
+                upsert_zone_data(session, zone, payload)
+                session.query(ZoneDataDelta).filter_by(zone=zone).delete()
+            else:
+                session.add(ZoneDataDelta(zone=zone, version=version, data=diff_json))
+    except Exception:
+        # Rantai delta di DB putus → tick berikutnya wajib checkpoint penuh
+        _last_summary.pop(zone, None)
+        raise
+
+    _last_summary[zone] = {"data": data, "deltas": 0 if checkpoint else last["deltas"] + 1, "version": version}
+
+    # Publish ke snapshot memori agar route dashboard tidak perlu query DB
+    snapshots.publish(zone, payload, diff=diff)
+    TICKS.inc(zone=zone, result="saved")
+    PAYLOAD_BYTES.set(len(payload) if checkpoint else len(diff_json), zone=zone, kind="checkpoint" if checkpoint else "delta")
+
+    log.info(
+        "[%s] Saved %s %d B (in:%d out:%d cur:%d)", zone.upper(),
+        "checkpoint" if checkpoint else "delta", len(payload) if checkpoint else len(diff_json),
+        data["totalin"], data["totalout"], data["totalcur"],
+    )
+
+def timed_tick(zone: str, interval: int, elapsed: float):
+    """Catat durasi tick; tick lebih lama dari interval berarti tick berikutnya terlambat."""
+    TICK_SECONDS.observe(elapsed, zone=zone)
+    if elapsed > interval:
+        TICK_OVERRUNS.inc(zone=zone)
+        log.warning("[%s] Tick %.1fs melebihi interval %ds", zone.upper(), elapsed, interval)
+
+def zone_devices(cfg: dict):
     in_devices = [d.strip() for d in os.getenv(cfg["in_env"], "").split(",") if d.strip()]
     out_devices = [d.strip() for d in os.getenv(cfg["out_env"], "").split(",") if d.strip()]
+    return in_devices, out_devices
+
+async def zone_loop(cfg: dict, pool: DbPool = None):
+    name = cfg["name"]
+    in_devices, out_devices = zone_devices(cfg)
     interval = int(os.getenv(cfg["interval_env"], "30"))
 
     if not in_devices or not out_devices:
         log.warning("[%s] IN/OUT devices kosong", name.upper())
         return
 
-    log.info("[%s] Interval: %ds", name.upper(), interval)
+    fetcher = EventFetcher(dsn=os.getenv("DATABASE_URL"), incremental=True, pool=pool) if INCREMENTAL_FETCH else None
+    processor = IncrementalEventProcessor(
+        {d.lower() for d in in_devices}, {d.lower() for d in out_devices}
+    ) if INCREMENTAL_FETCH else None
+
+    log.info("[%s] Interval: %ds%s", name.upper(), interval, " (incremental)" if fetcher else "")
+    TICK_INTERVAL.set(interval, zone=name)
     while True:
-        await fetch_and_store(name, in_devices, out_devices)
+        started = time.perf_counter()
+        await fetch_and_store(name, in_devices, out_devices, fetcher, pool, processor)
+        timed_tick(name, interval, time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+async def fetch_and_store_all(tracker: MultiZoneTracker):
+    zones = ", ".join(z.upper() for z in tracker.processors)
+    try:
+        log.info("[%s] Fetching (shared)...", zones)
+        summaries = await asyncio.wait_for(tracker.run(), timeout=120)
+    except asyncio.TimeoutError:
+        TICK_TIMEOUTS.inc(zone="shared")
+        TICKS.inc(zone="shared", result="timeout")
+        log.warning("[%s] Timeout", zones)
+        return
+    except Exception:
+        TICKS.inc(zone="shared", result="error")
+        log.exception("[%s] Error saat fetch_store", zones)
+        return
+
+    for zone, data in summaries.items():
+        try:
+            store_zone(zone, data)
+        except Exception:
+            TICKS.inc(zone=zone, result="error")
+            log.exception("[%s] Error saat store", zone.upper())
+
+async def shared_loop(configs: List[dict], pool: DbPool = None):
+    zones = {}
+    intervals = []
+    for cfg in configs:
+        in_devices, out_devices = zone_devices(cfg)
+        if not in_devices or not out_devices:
+            log.warning("[%s] IN/OUT devices kosong", cfg["name"].upper())
+            continue
+        zones[cfg["name"]] = (in_devices, out_devices)
+        intervals.append(int(os.getenv(cfg["interval_env"], "30")))
+
+    if not zones:
+        return
+
+    # Zona dengan interval terpendek menentukan ritme fetch bersama
+    interval = min(intervals)
+    fetcher = EventFetcher(dsn=os.getenv("DATABASE_URL"), incremental=True, pool=pool) if INCREMENTAL_FETCH else None
+
+    log.info("[SHARED] Zones: %s, interval: %ds%s", ", ".join(zones), interval, " (incremental)" if fetcher else "")
+    # Satu tracker untuk semua tick agar state processor incremental bertahan
+    tracker = MultiZoneTracker(zones, fetcher=fetcher, pool=pool)
+    TICK_INTERVAL.set(interval, zone="shared")
+    while True:
+        started = time.perf_counter()
+        await fetch_and_store_all(tracker)
+        timed_tick("shared", interval, time.perf_counter() - started)
         await asyncio.sleep(interval)
 
 async def run_worker():
     log.info("Worker start")
-    await asyncio.gather(*(zone_loop(z) for z in ZONES))
+
+    # Satu pool asyncpg untuk seluruh worker (dibuat ulang otomatis kalau DB putus)
+    pool = DbPool(os.getenv("DATABASE_URL"))
+    await pool.start()
+    health = asyncio.create_task(pool.health_loop())
+    listener = asyncio.create_task(ChangeListener(os.getenv("DATABASE_URL")).run()) if CHANGE_LISTENER else None
+
+    try:
+        if SHARED_FETCH:
+            await shared_loop(ZONES, pool)
+        else:
+            await asyncio.gather(*(zone_loop(z, pool) for z in ZONES))
+    finally:
+        health.cancel()
+        if listener is not None:
+            listener.cancel()
+        await pool.close()
 
 def setup_graceful_shutdown(loop: asyncio.AbstractEventLoop):
     async def shutdown():
@@ -119,3 +268,4 @@ if __name__ == "__main__":
         log.info("Exit gracefully")
     finally:
         loop.close()
+        dispose_engine()